@@ -29,7 +29,7 @@ class BoilderPlate(cmdln.Cmdln):
         elif (self.options.verbose):
             self.logger.setLevel(logging.INFO)
 
-        DB.Base.metadata.create_all(DB.db_engine())
+        DB.db_create()
         self.session = DB.db_session()
 
     def do_list(self, subcmd, opts, *args):
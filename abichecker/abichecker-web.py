@@ -17,6 +17,11 @@ app.config.from_object(__name__)
 #    """Creates the database tables."""
 #    Base.metadata.create_all(db_engine())
 
+@app.teardown_appcontext
+def remove_session(exception=None):
+    # sessions are per thread, start each request with a fresh one
+    db_session().remove()
+
 @app.route('/')
 def list():
     session = db_session()
@@ -1,15 +1,22 @@
 #!/usr/bin/python3
 
+from datetime import datetime
 from pprint import pformat
 from stat import S_ISREG, S_ISLNK
-from tempfile import NamedTemporaryFile
+from tempfile import NamedTemporaryFile, mkdtemp
+from concurrent.futures import Future, ThreadPoolExecutor
+import atexit
 import cmdln
 import logging
+import mmap
 import os
 import re
+import shelve
 import shutil
+import struct
 import subprocess
 import sys
+import threading
 import time
 import abichecker_dbmodel as DB
 import sqlalchemy.orm.exc
@@ -18,13 +25,15 @@ from lxml import etree as ET
 
 import osc.conf
 import osc.core
-from osc.util.cpio import CpioRead
 
 from urllib.error import HTTPError
 
 import rpm
+from collections import defaultdict
 from collections import namedtuple
 from osclib.comments import CommentAPI
+from osclib.memoize import memoize
+from osclib.memoize import memoize_session_reset
 
 from abichecker_common import CACHEDIR
 
@@ -59,20 +68,142 @@ ARCH_WHITELIST = {
         'SUSE:SLE-12:Update' :   ('i586', 'ppc64le', 's390', 's390x', 'x86_64'),
         }
 
+# projects that source projects build against under another name
+REPO_PROJECT_ALIASES = {
+        'openSUSE:Tumbleweed':   'openSUSE:Factory',
+        }
+
 # Directory where download binary packages.
 DOWNLOADS = os.path.join(CACHEDIR, 'downloads')
-UNPACKDIR = os.path.join(CACHEDIR, 'unpacked')
+# Size the download cache is trimmed to after each check.
+DOWNLOADS_MAX_SIZE = 4 * 1024 * 1024 * 1024
+# Buffer size used when writing out downloaded or extracted files.
+COPY_BUFSIZE = 1024 * 1024
+# Default number of binary packages to download in parallel.
+DOWNLOAD_WORKERS = 8
+# Number of log lines to collect before writing them to the database.
+LOG_FLUSH_SIZE = 100
+# The API answers are verbose XML, have them compressed.
+XML_REQUEST_HEADERS = {'Accept-Encoding': 'gzip'}
+# Default number of seconds to reuse a fetched project meta.
+META_TTL = 300
+# Number of package classifications to keep on disk.
+PKGCLASS_SLOTS = 16384
+# Number of repo check results to keep in memory.
+REPO_RESULT_SLOTS = 1024
+
+# matches the bytes file names in the cpioheaders view
+rpm_re = re.compile(rb'(.+\.rpm)-[0-9A-Fa-f]{32}$')
+# rpm file names of packages compute_fetchlist() skips anyway: source
+# packages and the repackaged -32bit and -64bit ones
+skiprpm_re = re.compile(rb'(?:-(?:32|64)bit-[^-]+-[^-]+|\.(?:no)?src)\.rpm$')
+so_re = re.compile(r'^(?:/usr)?/lib(?:64)?/lib([^/]+)\.so(?:\.[^/]+)?', re.ASCII)
+disturl_re = re.compile(r'^obs://[^/]+/(?P<prj>[^/]+)/(?P<repo>[^/]+)/(?P<md5>[0-9a-f]{32})-(?P<pkg>.*)$', re.ASCII)
+
+comment_marker_re = re.compile(r'<!-- abichecker state=(?P<state>done|seen)(?: result=(?P<result>accepted|declined))? -->', re.ASCII)
+
+# directories so_re accepts libraries from, as bytes like the rpm file list
+LIBDIRS = frozenset((b'/lib', b'/lib64', b'/usr/lib', b'/usr/lib64'))
+DEBUGPKG_SUFFIXES = tuple('-debug%s%s'%(kind, bits) for kind in ('source', 'info') for bits in ('', '-32bit', '-64bit'))
+
+
+def is_lib(path):
+    """ cheap version of so_re.match() for the bytes file list scan """
+    dirname, _, basename = path.rpartition(b'/')
+    return dirname in LIBDIRS and basename.startswith(b'lib') and basename.find(b'.so', 4) != -1
+
+
+def is_debugpkg(pkgname):
+    return pkgname.endswith(DEBUGPKG_SUFFIXES)
+
+
+def restrict_fetchlist(fetchlist, libs, debuglist):
+    """ reduce fetchlist to the packages and files needed for libs """
+    wanted = set(libs) | {debuglist[lib] for lib in libs}
+    return {fn: files & wanted for fn, files in fetchlist.items() if files & wanted}
+
+
+def cpio_members(buf):
+    """ yield name, data offset and size of the members of the newc
+    cpio archive in buf """
+    pos = 0
+    while True:
+        if buf[pos:pos+6] != b'070701':
+            raise FetchError('invalid cpio header at offset %d'%pos)
+        size = int(buf[pos+54:pos+62], 16)
+        namesize = int(buf[pos+94:pos+102], 16)
+        name = buf[pos+110:pos+110+namesize-1]
+        # name and data are padded to four bytes
+        pos = (pos + 110 + namesize + 3) & ~3
+        if name == b'TRAILER!!!':
+            return
+        yield name, pos, size
+        pos = (pos + size + 3) & ~3
+
+
+def open_noatime(path):
+    """ open path for reading without updating the access time """
+    try:
+        return os.open(path, os.O_RDONLY | getattr(os, 'O_NOATIME', 0))
+    except PermissionError:
+        # O_NOATIME is only allowed for the owner of the file
+        return os.open(path, os.O_RDONLY)
 
-so_re = re.compile(r'^(?:/usr)?/lib(?:64)?/lib([^/]+)\.so(?:\.[^/]+)?')
-debugpkg_re = re.compile(r'-debug(?:source|info)(?:-(?:32|64)bit)?$')
-disturl_re = re.compile(r'^obs://[^/]+/(?P<prj>[^/]+)/(?P<repo>[^/]+)/(?P<md5>[0-9a-f]{32})-(?P<pkg>.*)$')
 
-comment_marker_re = re.compile(r'<!-- abichecker state=(?P<state>done|seen)(?: result=(?P<result>accepted|declined))? -->')
+def has_debug_info(path):
+    """ check the ELF section headers of path for a .debug_info section.
+    Returns True in case of doubt so abi-dumper gets to decide, only a
+    well-formed ELF file without .debug_info or .gnu_debuglink gives False.
+    """
+    try:
+        with open(path, 'rb') as fh:
+            ident = fh.read(16)
+            if len(ident) < 16 or ident[:4] != b'\x7fELF' or ident[5] not in (1, 2):
+                return True
+            endian = '<' if ident[5] == 1 else '>'
+            if ident[4] == 2:
+                ehdr = struct.Struct(endian + 'HHIQQQIHHHHHH')
+                shdr = struct.Struct(endian + 'IIQQQQ')
+            elif ident[4] == 1:
+                ehdr = struct.Struct(endian + 'HHIIIIIHHHHHH')
+                shdr = struct.Struct(endian + 'IIIIII')
+            else:
+                return True
+            fields = ehdr.unpack(fh.read(ehdr.size))
+            e_shoff, e_shentsize, e_shnum, e_shstrndx = fields[5], fields[10], fields[11], fields[12]
+            if e_shoff == 0:
+                return False
+            if e_shnum == 0 or e_shstrndx >= e_shnum or e_shentsize < shdr.size:
+                # extended section numbering or unknown section headers
+                return True
+
+            fh.seek(e_shoff)
+            table = fh.read(e_shentsize * e_shnum)
+            _, _, _, _, stroff, strsize = shdr.unpack_from(table, e_shstrndx * e_shentsize)
+            fh.seek(stroff)
+            strtab = fh.read(strsize)
+            debuglink = False
+            for i in range(e_shnum):
+                name, sh_type, _, _, _, size = shdr.unpack_from(table, i * e_shentsize)
+                name = strtab[name:strtab.find(b'\0', name)]
+                if name == b'.debug_info':
+                    # SHT_NOBITS means stripped
+                    return sh_type != 8 and size > 0
+                if name == b'.gnu_debuglink':
+                    debuglink = True
+            # the debug info is somewhere else then
+            return debuglink
+    except (OSError, struct.error):
+        # e.g. a debug file that wasn't extracted, let abi-dumper fail
+        # on it so the request is looked at again
+        return True
 
 # report for source submissions. contains multiple libresult for each library
 Report = namedtuple('Report', ('src_project', 'src_package', 'src_rev', 'dst_project', 'dst_package', 'reports', 'result'))
 # report for a single library
 LibResult = namedtuple('LibResult', ('src_repo', 'src_lib', 'dst_repo', 'dst_lib', 'arch', 'htmlreport', 'result'))
+# libraries, (alias, libname) symlinks and debug files found in a package
+PkgClass = namedtuple('PkgClass', ('libs', 'aliases', 'debugfiles'))
 
 
 class DistUrlMismatch(Exception):
@@ -94,9 +225,11 @@ class SourceBroken(Exception):
 
 
 class NoBuildSuccess(Exception):
-    def __init__(self, project, package, md5):
+    def __init__(self, project, package, md5, repos=None):
         Exception.__init__(self)
         self.msg = '%s/%s(%s) had no successful build'%(project, package, md5)
+        if repos:
+            self.msg += ' in %s'%', '.join('%s/%s'%r for r in repos)
 
     def __str__(self):
         return self.msg
@@ -146,34 +279,99 @@ class MaintenanceError(Exception):
 class LogToDB(logging.Filter):
     def __init__(self, session):
         self.session = session
-        self.request_id = None
+        self._request_id = None
+        # log lines are written in batches rather than one commit per line
+        self.buffer = []
+        # repos are checked in threads but the session is shared
+        self.lock = threading.Lock()
+        # don't lose the last lines when the bot exits
+        atexit.register(self.flush)
+
+    @property
+    def request_id(self):
+        return self._request_id
+
+    @request_id.setter
+    def request_id(self, request_id):
+        self.flush()
+        self._request_id = request_id
 
     def filter(self, record):
         if self.request_id is not None and record.levelno >= logging.INFO:
-            logentry = DB.Log(request_id = self.request_id, line = record.getMessage())
-            self.session.add(logentry)
-            self.session.commit()
+            logentry = {'request_id': self.request_id, 'line': record.getMessage(), 't_created': datetime.now()}
+            with self.lock:
+                self.buffer.append(logentry)
+                if len(self.buffer) >= LOG_FLUSH_SIZE:
+                    self._flush()
         return True
 
+    def flush(self):
+        with self.lock:
+            self._flush()
+
+    def _flush(self):
+        if self.buffer:
+            self.session.bulk_insert_mappings(DB.Log, self.buffer)
+            self.session.commit()
+            self.buffer = []
+            # this is the only use of the session in the worker threads,
+            # don't keep their sessions around once they are done
+            if threading.current_thread() is not threading.main_thread():
+                self.session.remove()
+
 
 class ABIChecker(ReviewBot.ReviewBot):
     """ check ABI of library packages
     """
 
+    @property
+    def text_summary(self):
+        return ''.join(self.summary_parts)
+
+    @text_summary.setter
+    def text_summary(self, value):
+        self.summary_parts = [value] if value else []
+
     def __init__(self, *args, **kwargs):
         ReviewBot.ReviewBot.__init__(self, *args, **kwargs)
 
         self.no_review = False
         self.force = False
+        self.download_workers = DOWNLOAD_WORKERS
+        self.meta_ttl = META_TTL
 
         self.ts = rpm.TransactionSet()
-        self.ts.setVSFlags(rpm._RPMVSF_NOSIGNATURES)
+        # only headers and payloads are read, no need to verify
+        self.ts.setVSFlags(rpm._RPMVSF_NOSIGNATURES | rpm._RPMVSF_NODIGESTS)
+        self.ts_lock = threading.Lock()
+
+        # abi-dumper and abi-compliance-checker are CPU and memory bound,
+        # all checks share one pool to run no more of them than CPUs
+        self.tool_executor = ThreadPoolExecutor(max_workers=os.cpu_count() or 1)
+
+        # holds plain tuples, a PkgClass pickled from the script would
+        # only load in __main__
+        self.pkgclass_cache = shelve.open(os.path.join(CACHEDIR, 'pkgclass'), protocol=-1)
+        self.pkgclass_lock = threading.Lock()
+        atexit.register(self.close_pkgclass_cache)
+
+        # futures of the verifymd5 by project, package and disturl md5
+        self.verifymd5_cache = dict()
+        self.verifymd5_lock = threading.Lock()
+
+        # results of _check_repo() by source and target revision
+        self.repo_results = dict()
+        self.repo_results_lock = threading.Lock()
+
+        # project metas with the time they were fetched
+        self.meta_cache = dict()
+        self.meta_lock = threading.Lock()
 
         # reports of source submission
         self.reports = []
         # textual report summary for use in accept/decline message
-        # or comments
-        self.text_summary = ''
+        # or comments, collected in pieces and joined by text_summary
+        self.summary_parts = []
 
         self.session = DB.db_session()
 
@@ -227,19 +425,16 @@ class ABIChecker(ReviewBot.ReviewBot):
         if src_srcinfo is None:
             msg = "%s/%s@%s does not exist!? can't check"%(src_project, src_package, src_rev)
             self.logger.error(msg)
-            self.text_summary += msg + "\n"
+            self.summary_parts.append(msg + "\n")
             self.reports.append(report)
             return False
 
-        if os.path.exists(UNPACKDIR):
-            shutil.rmtree(UNPACKDIR)
-
         try:
             # compute list of common repos to find out what to compare
             myrepos = self.findrepos(src_project, src_srcinfo, dst_project, dst_srcinfo)
         except NoBuildSuccess as e:
             self.logger.info(e)
-            self.text_summary += "**Error**: %s\n"%e
+            self.summary_parts.append("**Error**: %s\n"%e)
             self.reports.append(report)
             return False
         except NotReadyYet as e:
@@ -248,12 +443,12 @@ class ABIChecker(ReviewBot.ReviewBot):
             return None
         except SourceBroken as e:
             self.logger.error(e)
-            self.text_summary += "**Error**: %s\n"%e
+            self.summary_parts.append("**Error**: %s\n"%e)
             self.reports.append(report)
             return False
 
         if not myrepos:
-            self.text_summary += "**Error**: %s does not build against %s, can't check library ABIs\n\n"%(src_project, dst_project)
+            self.summary_parts.append("**Error**: %s does not build against %s, can't check library ABIs\n\n"%(src_project, dst_project))
             self.logger.info("no matching repos, can't compare")
             self.reports.append(report)
             return False
@@ -272,13 +467,13 @@ class ABIChecker(ReviewBot.ReviewBot):
             if new_repo_map is not None:
                 myrepos = new_repo_map
         except MaintenanceError as e:
-            self.text_summary += "**Error**: %s\n\n"%e
+            self.summary_parts.append("**Error**: %s\n\n"%e)
             self.logger.error('%s', e)
             self.reports.append(report)
             return False
         except NoBuildSuccess as e:
             self.logger.info(e)
-            self.text_summary += "**Error**: %s\n"%e
+            self.summary_parts.append("**Error**: %s\n"%e)
             self.reports.append(report)
             return False
         except NotReadyYet as e:
@@ -287,140 +482,217 @@ class ABIChecker(ReviewBot.ReviewBot):
             return None
         except SourceBroken as e:
             self.logger.error(e)
-            self.text_summary += "**Error**: %s\n"%e
+            self.summary_parts.append("**Error**: %s\n"%e)
             self.reports.append(report)
             return False
 
-        notes = []
         libresults = []
 
         overall = None
 
         missing_debuginfo  = []
 
-        for mr in myrepos:
-            try:
-                dst_libs, dst_libdebug = self.extract(dst_project, dst_package, dst_srcinfo, mr.dstrepo, mr.arch)
-                # nothing to fetch, so no libs
-                if dst_libs is None:
-                    continue
-            except DistUrlMismatch as e:
-                self.logger.error("%s/%s %s/%s: %s"%(dst_project, dst_package, mr.dstrepo, mr.arch, e))
-                if ret == True: # need to check again
-                    ret = None
-                continue
-            except MissingDebugInfo as e:
-                missing_debuginfo.append(str(e))
+        # each repo/arch combination is independent so check them in
+        # parallel. Results are merged in a fixed order to keep the
+        # summary stable.
+        myrepos = sorted(myrepos)
+        unpackdir = mkdtemp(prefix='abichk-', dir=CACHEDIR)
+        try:
+            # _maintenance_hack may have mapped away all repos
+            with ThreadPoolExecutor(max_workers=max(1, len(myrepos))) as executor:
+                futures = [executor.submit(self._check_repo, mr, unpackdir,
+                                           src_project, src_package, src_srcinfo,
+                                           dst_project, dst_package, dst_srcinfo)
+                           for mr in myrepos]
+                results = [f.result() for f in futures]
+        finally:
+            shutil.rmtree(unpackdir, ignore_errors=True)
+
+        for repo_ret, repo_libresults, repo_missing_debuginfo, repo_summary in results:
+            if repo_ret == False:
                 ret = False
-                continue
-            except FetchError as e:
-                self.logger.error(e)
-                if ret == True: # need to check again
-                    ret = None
-                continue
+            elif repo_ret is None and ret == True: # need to check again
+                ret = None
+            libresults += repo_libresults
+            missing_debuginfo += repo_missing_debuginfo
+            self.summary_parts.extend(repo_summary)
+
+        for r in libresults:
+            if overall is None:
+                overall = r.result
+            elif overall == True and r.result == False:
+                overall = r.result
 
-            try:
-                src_libs, src_libdebug = self.extract(src_project, src_package, src_srcinfo, mr.srcrepo, mr.arch)
-                if src_libs is None:
-                    if dst_libs:
-                        self.text_summary += "*Warning*: the submission does not contain any libs anymore\n\n"
-                    continue
-            except DistUrlMismatch as e:
-                self.logger.error("%s/%s %s/%s: %s"%(src_project, src_package, mr.srcrepo, mr.arch, e))
-                if ret == True: # need to check again
-                    ret = None
-                continue
-            except MissingDebugInfo as e:
-                missing_debuginfo.append(str(e))
-                ret = False
-                continue
-            except FetchError as e:
-                self.logger.error(e)
-                if ret == True: # need to check again
-                    ret = None
-                continue
+        if missing_debuginfo:
+            self.summary_parts.append('debug information is missing for the following packages, can\'t check:\n<pre>')
+            self.summary_parts.append(''.join(missing_debuginfo))
+            self.summary_parts.append('</pre>\nplease enable debug info in your project config.\n')
 
-            # create reverse index for aliases in the source project
-            src_aliases = dict()
-            for lib in src_libs.keys():
-                for a in src_libs[lib]:
-                    src_aliases.setdefault(a, set()).add(lib)
-
-            # for each library in the destination project check if the same lib
-            # exists in the source project. If not check the aliases (symlinks)
-            # to catch soname changes. Generate pairs of matching libraries.
-            pairs = set()
-            for lib in dst_libs.keys():
-                if lib in src_libs:
-                    pairs.add((lib, lib))
-                else:
-                    self.logger.debug("%s not found in submission, checking aliases", lib)
-                    found = False
-                    for a in dst_libs[lib]:
-                        if a in src_aliases:
-                            for l in src_aliases[a]:
-                                pairs.add((lib, l))
-                                found = True
-                    if found == False:
-                        self.text_summary += "*Warning*: %s no longer packaged\n\n"%lib
-
-            self.logger.debug("to diff: %s", pformat(pairs))
-
-            # for each pair dump and compare the abi
-            for old, new in pairs:
-                # abi dump of old lib
-                old_base = os.path.join(UNPACKDIR, dst_project, dst_package, mr.dstrepo, mr.arch)
-                old_dump = os.path.join(CACHEDIR, 'old.dump')
-                # abi dump of new lib
-                new_base = os.path.join(UNPACKDIR, src_project, src_package, mr.srcrepo, mr.arch)
-                new_dump = os.path.join(CACHEDIR, 'new.dump')
-
-                def cleanup():
-                    if os.path.exists(old_dump):
-                        os.unlink(old_dump)
-                    if os.path.exists(new_dump):
-                        os.unlink(new_dump)
-
-                cleanup()
-
-                # we just need that to pass a name to abi checker
-                m = so_re.match(old)
-                htmlreport = 'report-%s-%s-%s-%s-%s-%08x.html'%(mr.srcrepo, os.path.basename(old), mr.dstrepo, os.path.basename(new), mr.arch, int(time.time()))
-
-                # run abichecker
-                if m \
-                    and self.run_abi_dumper(old_dump, old_base, old, dst_libdebug[old]) \
-                    and self.run_abi_dumper(new_dump, new_base, new, src_libdebug[new]):
-                        reportfn = os.path.join(CACHEDIR, htmlreport)
-                        r = self.run_abi_checker(m.group(1), old_dump, new_dump, reportfn)
-                        if r is not None:
-                            self.logger.debug('report saved to %s, compatible: %d', reportfn, r)
-                            libresults.append(LibResult(mr.srcrepo, os.path.basename(old), mr.dstrepo, os.path.basename(new), mr.arch, htmlreport, r))
-                            if overall is None:
-                                overall = r
-                            elif overall == True and r == False:
-                                overall = r
+        self.reports.append(report._replace(result = overall, reports = libresults))
+
+        self.prune_downloads()
+
+        return ret
+
+    def _check_repo(self, mr, unpackdir, src_project, src_package, src_srcinfo, dst_project, dst_package, dst_srcinfo):
+        """ compare the libraries of one MatchRepo.
+        Returns a tuple of (ret, libresults, missing_debuginfo, summary)
+        where summary is a list of lines for the text summary
+        """
+        # the same sources compared against the same target give the
+        # same result, e.g. when a request is looked at again or another
+        # request submits the same revision
+        key = (src_project, src_package, src_srcinfo.verifymd5, dst_project, dst_package, dst_srcinfo.verifymd5, mr)
+        with self.repo_results_lock:
+            if key in self.repo_results:
+                self.logger.debug("using previous result for %s", pformat(key))
+                return self.repo_results[key]
+
+        result = self._compare_repo(mr, unpackdir, src_project, src_package, src_srcinfo, dst_project, dst_package, dst_srcinfo)
+        # temporary problems need a new look next time
+        if result[0] is not None:
+            with self.repo_results_lock:
+                if len(self.repo_results) >= REPO_RESULT_SLOTS:
+                    self.repo_results.clear()
+                self.repo_results[key] = result
+        return result
+
+    def _compare_repo(self, mr, unpackdir, src_project, src_package, src_srcinfo, dst_project, dst_package, dst_srcinfo):
+        ret = True
+        libresults = []
+        missing_debuginfo = []
+        summary = []
+
+        # private directory so parallel checks don't step on each other
+        workdir = mkdtemp(prefix='%s-%s-'%(mr.srcrepo, mr.arch), dir=unpackdir)
+
+        # only look at the rpm headers first to find out which libraries
+        # need to be compared
+        try:
+            dst_fetchlist, dst_libs, dst_libdebug = self.scan(dst_project, dst_package, dst_srcinfo, mr.dstrepo, mr.arch)
+            # nothing to fetch, so no libs
+            if dst_libs is None:
+                return ret, libresults, missing_debuginfo, summary
+        except DistUrlMismatch as e:
+            self.logger.error("%s/%s %s/%s: %s"%(dst_project, dst_package, mr.dstrepo, mr.arch, e))
+            return None, libresults, missing_debuginfo, summary
+        except MissingDebugInfo as e:
+            missing_debuginfo.append(str(e))
+            return False, libresults, missing_debuginfo, summary
+        except FetchError as e:
+            self.logger.error(e)
+            return None, libresults, missing_debuginfo, summary
+
+        try:
+            src_fetchlist, src_libs, src_libdebug = self.scan(src_project, src_package, src_srcinfo, mr.srcrepo, mr.arch)
+            if src_libs is None:
+                if dst_libs:
+                    summary.append("*Warning*: the submission does not contain any libs anymore\n\n")
+                return ret, libresults, missing_debuginfo, summary
+        except DistUrlMismatch as e:
+            self.logger.error("%s/%s %s/%s: %s"%(src_project, src_package, mr.srcrepo, mr.arch, e))
+            return None, libresults, missing_debuginfo, summary
+        except MissingDebugInfo as e:
+            missing_debuginfo.append(str(e))
+            return False, libresults, missing_debuginfo, summary
+        except FetchError as e:
+            self.logger.error(e)
+            return None, libresults, missing_debuginfo, summary
+
+        # create reverse index for aliases in the source project
+        src_aliases = defaultdict(set)
+        for lib, aliases in src_libs.items():
+            for a in aliases:
+                src_aliases[a].add(lib)
+
+        # for each library in the destination project check if the same lib
+        # exists in the source project. If not check the aliases (symlinks)
+        # to catch soname changes. Generate pairs of matching libraries.
+        pairs = {(lib, lib) for lib in dst_libs.keys() & src_libs.keys()}
+        for lib in sorted(dst_libs.keys() - src_libs.keys()):
+            self.logger.debug("%s not found in submission, checking aliases", lib)
+            matches = set().union(*(src_aliases.get(a, ()) for a in dst_libs[lib]))
+            if not matches:
+                summary.append("*Warning*: %s no longer packaged\n\n"%lib)
+            pairs |= {(lib, l) for l in matches}
+
+        self.logger.debug("to diff: %s", pformat(pairs))
+
+        # now fetch only the packages that contain the libraries of the
+        # pairs and their debug info
+        try:
+            self.extract(dst_project, dst_package, mr.dstrepo, mr.arch,
+                         restrict_fetchlist(dst_fetchlist, {old for old, new in pairs}, dst_libdebug), workdir)
+            self.extract(src_project, src_package, mr.srcrepo, mr.arch,
+                         restrict_fetchlist(src_fetchlist, {new for old, new in pairs}, src_libdebug), workdir)
+        except FetchError as e:
+            self.logger.error(e)
+            return None, libresults, missing_debuginfo, summary
+
+        # for each pair dump and compare the abi. The pairs only wait for
+        # the tools, which run in the bot wide tool_executor.
+        old_base = os.path.join(workdir, dst_project, dst_package, mr.dstrepo, mr.arch)
+        new_base = os.path.join(workdir, src_project, src_package, mr.srcrepo, mr.arch)
+        # don't bother running abi-dumper if the debug files have no
+        # debug info to begin with
+        missing = set()
+        for old, new in pairs:
+            if not has_debug_info(os.path.join(old_base, dst_libdebug[old].lstrip('/'))):
+                missing.add((dst_project, dst_package, mr.dstrepo, mr.arch, dst_libdebug[old]))
+            if not has_debug_info(os.path.join(new_base, src_libdebug[new].lstrip('/'))):
+                missing.add((src_project, src_package, mr.srcrepo, mr.arch, src_libdebug[new]))
+        if missing:
+            self.logger.error('missing debuginfo: %s'%pformat(missing))
+            missing_debuginfo.append(str(MissingDebugInfo(sorted(missing))))
+            return False, libresults, missing_debuginfo, summary
+
+        pairs = sorted(pairs)
+        with ThreadPoolExecutor(max_workers=os.cpu_count() or 1) as executor:
+            futures = [executor.submit(self._check_pair, mr, workdir, i,
+                                       old_base, old, dst_libdebug[old],
+                                       new_base, new, src_libdebug[new])
+                       for i, (old, new) in enumerate(pairs)]
+            for (old, new), future in zip(pairs, futures):
+                libresult = future.result()
+                if libresult is not None:
+                    libresults.append(libresult)
                 else:
                     self.logger.error('failed to compare %s <> %s'%(old,new))
-                    self.text_summary += "**Error**: ABI check failed on %s vs %s\n\n"%(old, new)
-                    if ret == True: # need to check again
-                        ret = None
+                    summary.append("**Error**: ABI check failed on %s vs %s\n\n"%(old, new))
+                    ret = None
 
-                cleanup()
+        return ret, libresults, missing_debuginfo, summary
 
-        if missing_debuginfo:
-            self.text_summary += 'debug information is missing for the following packages, can\'t check:\n<pre>'
-            self.text_summary += ''.join(missing_debuginfo)
-            self.text_summary += '</pre>\nplease enable debug info in your project config.\n'
-
-        self.reports.append(report._replace(result = overall, reports = libresults))
+    def _check_pair(self, mr, workdir, i, old_base, old, old_debug, new_base, new, new_debug):
+        """ dump and compare the abi of a pair of libraries.
+        Returns a LibResult or None if the check failed
+        """
+        # we just need that to pass a name to abi checker
+        m = so_re.match(old)
+        if not m:
+            return None
 
-        # upload reports
+        old_dump = os.path.join(workdir, '%d-old.dump'%i)
+        new_dump = os.path.join(workdir, '%d-new.dump'%i)
+        htmlreport = 'report-%s-%s-%s-%s-%s-%08x.html'%(mr.srcrepo, os.path.basename(old), mr.dstrepo, os.path.basename(new), mr.arch, int(time.time()))
 
-        if os.path.exists(UNPACKDIR):
-            shutil.rmtree(UNPACKDIR)
+        try:
+            # both dumps are independent of each other
+            old_ok = self.tool_executor.submit(self.run_abi_dumper, old_dump, old_base, old, old_debug)
+            new_ok = self.tool_executor.submit(self.run_abi_dumper, new_dump, new_base, new, new_debug)
+            if not (old_ok.result() and new_ok.result()):
+                return None
 
-        return ret
+            reportfn = os.path.join(CACHEDIR, htmlreport)
+            r = self.tool_executor.submit(self.run_abi_checker, m.group(1), old_dump, new_dump, reportfn).result()
+            if r is None:
+                return None
+            self.logger.debug('report saved to %s, compatible: %d', reportfn, r)
+            return LibResult(mr.srcrepo, os.path.basename(old), mr.dstrepo, os.path.basename(new), mr.arch, htmlreport, r)
+        finally:
+            for fn in (old_dump, new_dump):
+                if os.path.exists(fn):
+                    os.unlink(fn)
 
     def _maintenance_hack(self, dst_project, dst_srcinfo, myrepos):
         pkg = dst_srcinfo.package
@@ -428,75 +700,87 @@ class ABIChecker(ReviewBot.ReviewBot):
         originpackage = None
 
         # find the maintenance project
-        url = osc.core.makeurl(self.apiurl, ('search', 'project', 'id'),
-            "match=(maintenance/maintains/@project='%s'+and+attribute/@name='%s')"%(dst_project, osc.conf.config['maintenance_attribute']))
-        root = ET.parse(osc.core.http_GET(url)).getroot()
-        if root is not None:
-            node = root.find('project')
-            if node is not None:
-                # check if target project is a project link where the
-                # sources don't actually build (like openSUSE:...:Update). That
-                # is the case if no update was released yet.
-                # XXX: TODO: do check for whether the package builds here first
-                originproject = self.get_originproject(dst_project, pkg)
-                if originproject is not None:
-                    self.logger.debug("origin project %s", originproject)
-                    url = osc.core.makeurl(self.apiurl, ('build', dst_project, '_result'), { 'package': pkg })
-                    root = ET.parse(osc.core.http_GET(url)).getroot()
-                    alldisabled = True
-                    for node in root.findall('status'):
-                        if node.get('code') != 'disabled':
-                            alldisabled = False
-                    if alldisabled:
-                        self.logger.debug("all repos disabled, using originproject %s"%originproject)
-                    else:
-                        originproject = None
+        mproject = self._search_maintenance_project(dst_project)
+        if mproject is not None:
+            # only one of the two is used in the end, look both up at
+            # once to save a round trip
+            with ThreadPoolExecutor(max_workers=2) as executor:
+                origin = executor.submit(self.get_originproject, dst_project, pkg)
+                linktarget = executor.submit(self._get_linktarget, dst_project, pkg)
+            # check if target project is a project link where the
+            # sources don't actually build (like openSUSE:...:Update). That
+            # is the case if no update was released yet.
+            # XXX: TODO: do check for whether the package builds here first
+            originproject = origin.result()
+            if originproject is not None:
+                self.logger.debug("origin project %s", originproject)
+                if self._all_builds_disabled(dst_project, pkg):
+                    self.logger.debug("all repos disabled, using originproject %s"%originproject)
                 else:
-                    mproject = node.attrib['name']
-                    # packages are only a link to packagename.incidentnr
-                    (linkprj, linkpkg) = self._get_linktarget(dst_project, pkg)
-                    if linkpkg is not None and linkprj == dst_project:
-                        self.logger.debug("%s/%s links to %s"%(dst_project, pkg, linkpkg))
-                        regex = re.compile(r'.*\.(\d+)$')
-                        m = regex.match(linkpkg)
-                        if m is None:
-                            raise MaintenanceError("%s/%s -> %s/%s is not a proper maintenance link (must match /%s/)"%(dst_project, pkg, linkprj, linkpkg, regex.pattern))
-                        incident = m.group(1)
-                        self.logger.debug("is maintenance incident %s"%incident)
-
-                        originproject = "%s:%s"%(mproject, incident)
-                        originpackage = pkg+'.'+dst_project.replace(':', '_')
-
-                        origin_srcinfo = self.get_sourceinfo(originproject, originpackage)
-                        if origin_srcinfo is None:
-                            raise MaintenanceError("%s/%s invalid"%(originproject, originpackage))
-
-                        # find the map of maintenance incident repos to destination repos
-                        originrepos = self.findrepos(originproject, origin_srcinfo, dst_project, dst_srcinfo)
-                        mapped = dict()
-                        for mr in originrepos:
-                            mapped[(mr.dstrepo, mr.arch)] = mr
-
-                        self.logger.debug("mapping: %s", pformat(mapped))
-
-                        # map the repos of the original request to the maintenance incident repos
-                        matchrepos = set()
-                        for mr in myrepos:
-                            if not (mr.dstrepo, mr.arch) in mapped:
-                                # sometimes a previously released maintenance
-                                # update didn't cover all architectures. We can
-                                # only ignore that then.
-                                self.logger.warning("couldn't find repo %s/%s in %s/%s"%(mr.dstrepo, mr.arch, originproject, originpackage))
-                                continue
-                            matchrepos.add(MR(mr.srcrepo, mapped[(mr.dstrepo, mr.arch)].srcrepo, mr.arch))
-
-                        myrepos = matchrepos
-                        dst_srcinfo = origin_srcinfo
-                        self.logger.debug("new repo map: %s", pformat(myrepos))
+                    originproject = None
+            else:
+                # packages are only a link to packagename.incidentnr
+                (linkprj, linkpkg) = linktarget.result()
+                if linkpkg is not None and linkprj == dst_project:
+                    self.logger.debug("%s/%s links to %s"%(dst_project, pkg, linkpkg))
+                    regex = re.compile(r'.*\.(\d+)$')
+                    m = regex.match(linkpkg)
+                    if m is None:
+                        raise MaintenanceError("%s/%s -> %s/%s is not a proper maintenance link (must match /%s/)"%(dst_project, pkg, linkprj, linkpkg, regex.pattern))
+                    incident = m.group(1)
+                    self.logger.debug("is maintenance incident %s"%incident)
+
+                    originproject = "%s:%s"%(mproject, incident)
+                    originpackage = pkg+'.'+dst_project.replace(':', '_')
+
+                    origin_srcinfo = self.get_sourceinfo(originproject, originpackage)
+                    if origin_srcinfo is None:
+                        raise MaintenanceError("%s/%s invalid"%(originproject, originpackage))
+
+                    # find the map of maintenance incident repos to destination repos
+                    originrepos = self.findrepos(originproject, origin_srcinfo, dst_project, dst_srcinfo)
+                    mapped = {(mr.dstrepo, mr.arch): mr for mr in originrepos}
+
+                    self.logger.debug("mapping: %s", pformat(mapped))
+
+                    # sometimes a previously released maintenance update didn't
+                    # cover all architectures. We can only ignore that then.
+                    for dstrepo, arch in sorted({(mr.dstrepo, mr.arch) for mr in myrepos} - mapped.keys()):
+                        self.logger.warning("couldn't find repo %s/%s in %s/%s"%(dstrepo, arch, originproject, originpackage))
+
+                    # map the repos of the original request to the maintenance incident repos
+                    matchrepos = {MR(mr.srcrepo, mapped[(mr.dstrepo, mr.arch)].srcrepo, mr.arch)
+                                  for mr in myrepos if (mr.dstrepo, mr.arch) in mapped}
+
+                    myrepos = matchrepos
+                    dst_srcinfo = origin_srcinfo
+                    self.logger.debug("new repo map: %s", pformat(myrepos))
 
         return (originproject, originpackage, dst_srcinfo, myrepos)
 
 
+    def _search_maintenance_project(self, project):
+        """ return the name of the maintenance project of project """
+        url = osc.core.makeurl(self.apiurl, ('search', 'project', 'id'),
+            "match=(maintenance/maintains/@project='%s'+and+attribute/@name='%s')"%(project, osc.conf.config['maintenance_attribute']))
+        for _, node in ET.iterparse(self._http_get(url), tag='project'):
+            return node.get('name')
+        return None
+
+    @memoize(session=True)
+    def _all_builds_disabled(self, project, package):
+        url = osc.core.makeurl(self.apiurl, ('build', project, '_result'), { 'package': package })
+        alldisabled = True
+        for _, node in ET.iterparse(self._http_get(url), tag='status'):
+            if node.get('code') != 'disabled':
+                alldisabled = False
+            node.clear()
+        return alldisabled
+
+    @memoize(session=True)
+    def _get_linktarget(self, src_project, src_package):
+        return ReviewBot.ReviewBot._get_linktarget(self, src_project, src_package)
+
     def find_abichecker_comment(self, req):
         """Return previous comments (should be one)."""
         comments = self.commentapi.get_comments(request_id=req.reqid)
@@ -524,6 +808,10 @@ class ABIChecker(ReviewBot.ReviewBot):
 #                self.logger.debug("request %s already done, result: %s"%(req.reqid, result))
 #                return
 
+        # build results and sources may have changed since the last
+        # request so drop what was cached so far
+        memoize_session_reset()
+
         self.dblogger.request_id = req.reqid
 
         self.current_request = req
@@ -583,43 +871,41 @@ class ABIChecker(ReviewBot.ReviewBot):
 
     def save_reports_to_db(self, req, state, result):
         try:
-            request = self.session.query(DB.Request).filter(DB.Request.id == req.reqid).one()
-            for i in self.session.query(DB.ABICheck).filter(DB.ABICheck.request_id == request.id).all():
-                # yeah, we could be smarter here and update existing reports instead
-                self.session.delete(i)
+            try:
+                request = self.session.query(DB.Request).filter(DB.Request.id == req.reqid).one()
+                for i in self.session.query(DB.ABICheck).filter(DB.ABICheck.request_id == request.id).all():
+                    # yeah, we could be smarter here and update existing reports instead
+                    self.session.delete(i)
+                self.session.flush()
+                request.state = state
+                request.result = result
+            except sqlalchemy.orm.exc.NoResultFound as e:
+                request = DB.Request(id = req.reqid,
+                        state = state,
+                        result = result,
+                        )
+                self.session.add(request)
+
+            abichecks = []
+            for r in self.reports:
+                abicheck = DB.ABICheck(
+                        request = request,
+                        src_project = r.src_project,
+                        src_package = r.src_package,
+                        src_rev = r.src_rev,
+                        dst_project = r.dst_project,
+                        dst_package = r.dst_package,
+                        result = r.result
+                        )
+                abichecks.append((r, abicheck))
+                self.session.add(abicheck)
+
+            # flush to get the ids of the checks for their lib reports
             self.session.flush()
-            request.state = state
-            request.result = result
-        except sqlalchemy.orm.exc.NoResultFound as e:
-            request = DB.Request(id = req.reqid,
-                    state = state,
-                    result = result,
-                    )
-            self.session.add(request)
-        self.session.commit()
-        for r in self.reports:
-            abicheck = DB.ABICheck(
-                    request = request,
-                    src_project = r.src_project,
-                    src_package = r.src_package,
-                    src_rev = r.src_rev,
-                    dst_project = r.dst_project,
-                    dst_package = r.dst_package,
-                    result = r.result
-                    )
-            self.session.add(abicheck)
-            self.session.commit()
-            if r.result is None:
-                continue
-            elif r.result:
-                self.text_summary += "Good news from ABI check, "
-                self.text_summary += "%s seems to be ABI [compatible](%s/request/%s):\n\n"%(r.dst_package, WEB_URL, req.reqid)
-            else:
-                self.text_summary += "Warning: bad news from ABI check, "
-                self.text_summary += "%s may be ABI [**INCOMPATIBLE**](%s/request/%s):\n\n"%(r.dst_package, WEB_URL, req.reqid)
-            for lr in r.reports:
-                libreport = DB.LibReport(
-                        abicheck = abicheck,
+            libreports = []
+            for r, abicheck in abichecks:
+                libreports.append([dict(
+                        submission_id = abicheck.id,
                         src_repo = lr.src_repo,
                         src_lib = lr.src_lib,
                         dst_repo = lr.dst_repo,
@@ -627,12 +913,27 @@ class ABIChecker(ReviewBot.ReviewBot):
                         arch = lr.arch,
                         htmlreport = lr.htmlreport,
                         result = lr.result,
-                        )
-                self.session.add(libreport)
-                self.session.commit()
-                self.text_summary += "* %s (%s): [%s](%s/report/%d)\n"%(lr.dst_lib, lr.arch,
+                        ) for lr in r.reports])
+            # also fills in the ids of the reports for the summary
+            DB.bulk_add_reports(self.session, [lr for reports in libreports for lr in reports])
+            self.session.commit()
+        except Exception:
+            self.session.rollback()
+            raise
+
+        for (r, abicheck), reports in zip(abichecks, libreports):
+            if r.result is None:
+                continue
+            elif r.result:
+                self.summary_parts.append("Good news from ABI check, ")
+                self.summary_parts.append("%s seems to be ABI [compatible](%s/request/%s):\n\n"%(r.dst_package, WEB_URL, req.reqid))
+            else:
+                self.summary_parts.append("Warning: bad news from ABI check, ")
+                self.summary_parts.append("%s may be ABI [**INCOMPATIBLE**](%s/request/%s):\n\n"%(r.dst_package, WEB_URL, req.reqid))
+            for lr, libreport in zip(r.reports, reports):
+                self.summary_parts.append("* %s (%s): [%s](%s/report/%d)\n"%(lr.dst_lib, lr.arch,
                     "compatible" if lr.result else "***INCOMPATIBLE***",
-                    WEB_URL, libreport.id)
+                    WEB_URL, libreport['id']))
 
         self.reports = []
 
@@ -677,7 +978,7 @@ class ABIChecker(ReviewBot.ReviewBot):
             return False
         return True
 
-    def extract(self, project, package, srcinfo, repo, arch):
+    def scan(self, project, package, srcinfo, repo, arch):
             # fetch cpio headers
             # check file lists for library packages
             fetchlist, liblist, debuglist = self.compute_fetchlist(project, package, srcinfo, repo, arch)
@@ -685,86 +986,139 @@ class ABIChecker(ReviewBot.ReviewBot):
             if not fetchlist:
                 msg = "no libraries found in %s/%s %s/%s"%(project, package, repo, arch)
                 self.logger.info(msg)
-                return None, None
-
-            # mtimes in cpio are not the original ones, so we need to fetch
-            # that separately :-(
-            mtimes= self._getmtimes(project, package, repo, arch)
+                return None, None, None
 
             self.logger.debug("fetchlist %s", pformat(fetchlist))
             self.logger.debug("liblist %s", pformat(liblist))
             self.logger.debug("debuglist %s", pformat(debuglist))
 
-            debugfiles = debuglist.values()
+            return fetchlist, liblist, debuglist
+
+    def extract(self, project, package, repo, arch, fetchlist, workdir):
+            if not fetchlist:
+                return
+
+            # mtimes in cpio are not the original ones, so we need to fetch
+            # that separately :-(
+            mtimes= self._getmtimes(project, package, repo, arch)
 
             # fetch binary rpms
             downloaded = self.download_files(project, package, repo, arch, fetchlist, mtimes)
 
             # extract binary rpms
-            tmpfile = os.path.join(CACHEDIR, "cpio")
-            for fn in fetchlist:
+            dstdir = os.path.join(workdir, project, package, repo, arch)
+            for fn, files in fetchlist.items():
                 self.logger.debug("extract %s"%fn)
-                with open(tmpfile, 'wb') as tmpfd:
-                    if fn not in downloaded:
-                        raise FetchError("%s was not downloaded!"%fn)
-                    self.logger.debug(downloaded[fn])
-                    r = subprocess.call(['rpm2cpio', downloaded[fn]], stdout=tmpfd, close_fds=True)
-                    if r != 0:
-                        raise FetchError("failed to extract %s!"%fn)
-                    tmpfd.close()
-                    os.unlink(downloaded[fn])
-                    cpio = CpioRead(tmpfile)
-                    cpio.read()
-                    for ch in cpio:
-                        fn = ch.filename.decode('utf-8')
-                        if fn.startswith('./'): # rpm payload is relative
-                            fn = fn[1:]
-                        self.logger.debug("cpio fn %s", fn)
-                        if fn not in liblist and fn not in debugfiles:
-                            continue
-                        dst = os.path.join(UNPACKDIR, project, package, repo, arch)
-                        dst += fn
-                        if not os.path.exists(os.path.dirname(dst)):
-                            os.makedirs(os.path.dirname(dst))
-                        self.logger.debug("dst %s", dst)
-                        # the filehandle in the cpio archive is private so
-                        # open it again
-                        with open(tmpfile, 'rb') as cpiofh:
-                            cpiofh.seek(ch.dataoff, os.SEEK_SET)
-                            with open(dst, 'wb') as fh:
-                                while True:
-                                    buf = cpiofh.read(4096)
-                                    if buf is None or buf == b'':
-                                        break
-                                    fh.write(buf)
-            os.unlink(tmpfile)
-
-            return liblist, debuglist
+                if fn not in downloaded:
+                    raise FetchError("%s was not downloaded!"%fn)
+                self.logger.debug(downloaded[fn])
+                self.extract_files(downloaded[fn], files, dstdir)
+
+    def extract_files(self, filename, wanted, dstdir):
+        """ unpack the files listed in wanted from the payload of the
+        rpm filename to dstdir. The payload is read in process, no need
+        for rpm2cpio and a temporary cpio archive.
+        """
+        osfd = open_noatime(filename)
+        fd = rpm.fd.open(osfd)
+        try:
+            h = self.readRpmHeaderFD(fd)
+            if h is None:
+                raise FetchError("failed to read rpm header of %s"%filename)
+            payload = rpm.fd.open(fd, flags=h['payloadcompressor'].decode('utf-8'))
+            archive = rpm.files(h).archive(payload)
+            remaining = set(wanted)
+            created = set()
+            for f in archive:
+                self.logger.debug("payload fn %s", f.name)
+                # only the last entry of hardlinked files carries the
+                # content, for all names of the file
+                if not archive.hascontent():
+                    continue
+                names = [n for n in (f.links if f.nlink > 1 else (f.name,)) if n in remaining]
+                if not names:
+                    continue
+                for name in names:
+                    dst = dstdir + name
+                    dirname = os.path.dirname(dst)
+                    if dirname not in created:
+                        os.makedirs(dirname, exist_ok=True)
+                        created.add(dirname)
+                    self.logger.debug("dst %s", dst)
+                    if name == names[0]:
+                        with open(dst, 'wb') as fh:
+                            shutil.copyfileobj(archive, fh, COPY_BUFSIZE)
+                    else:
+                        shutil.copyfile(dstdir + names[0], dst)
+                remaining.difference_update(names)
+                # no need to decompress the rest of the payload
+                if not remaining:
+                    break
+        except (rpm.error, OSError, ValueError) as e:
+            raise FetchError("failed to extract %s: %s"%(filename, e))
+        finally:
+            fd.close()
+            os.close(osfd)
 
     def download_files(self, project, package, repo, arch, filenames, mtimes):
-        downloaded = dict()
         for fn in filenames:
             if fn not in mtimes:
                 raise FetchError("missing mtime information for %s, can't check"% fn)
-            repodir = os.path.join(DOWNLOADS, package, project, repo)
-            if not os.path.exists(repodir):
-                os.makedirs(repodir)
-            t = os.path.join(repodir, fn)
-            self._get_binary_file(project, repo, arch, package, fn, t, mtimes[fn])
-            downloaded[fn] = t
+        repodir = os.path.join(DOWNLOADS, project, repo, arch)
+        if not os.path.exists(repodir):
+            os.makedirs(repodir, exist_ok=True)
+
+        downloaded = dict()
+        with ThreadPoolExecutor(max_workers=self.download_workers) as executor:
+            futures = dict()
+            for fn in filenames:
+                # the mtime changes with every rebuild, so a file with
+                # that name is always current
+                name, ext = os.path.splitext(fn)
+                t = os.path.join(repodir, '%s-%s%s'%(name, mtimes[fn], ext))
+                futures[fn] = executor.submit(self._get_binary_file, project, repo, arch, package, fn, t, mtimes[fn])
+                downloaded[fn] = t
+            for fn, future in futures.items():
+                try:
+                    future.result()
+                except HTTPError as e:
+                    raise FetchError("failed to download %s: %s"%(fn, e))
         return downloaded
 
     def _get_binary_file(self, project, repository, arch, package, filename, target, mtime):
-        """Get a binary file from OBS."""
-        # Used to cache, but dropped as part of python3 migration.
+        """Get a binary file from OBS unless it's cached already."""
+        if os.path.exists(target):
+            # mark as recently used for prune_downloads()
+            os.utime(target)
+            return
         osc.core.get_binary_file(self.apiurl, project, repository, arch,
                                  filename, package=package,
                                  target_filename=target)
 
+    def prune_downloads(self):
+        """ remove least recently used binaries until the download cache
+        is smaller than DOWNLOADS_MAX_SIZE """
+        files = []
+        total = 0
+        for root, dirs, filenames in os.walk(DOWNLOADS):
+            for fn in filenames:
+                path = os.path.join(root, fn)
+                st = os.stat(path)
+                files.append((st.st_mtime, st.st_size, path))
+                total += st.st_size
+
+        for mtime, size, path in sorted(files):
+            if total <= DOWNLOADS_MAX_SIZE:
+                break
+            self.logger.debug("prune %s", path)
+            os.unlink(path)
+            total -= size
+
     def readRpmHeaderFD(self, fd):
         h = None
         try:
-            h = self.ts.hdrFromFdno(fd)
+            with self.ts_lock:
+                h = self.ts.hdrFromFdno(fd)
         except rpm.error as e:
             if str(e) == "public key not available":
                 print(str(e))
@@ -782,34 +1136,45 @@ class ABIChecker(ReviewBot.ReviewBot):
             r = osc.core.http_GET(u)
         except HTTPError as e:
             raise FetchError('failed to fetch header information: %s'%e)
-        tmpfile = NamedTemporaryFile(prefix="cpio-", delete=False)
-        for chunk in r:
-            tmpfile.write(chunk)
-        tmpfile.close()
-        cpio = CpioRead(tmpfile.name)
-        cpio.read()
-        rpm_re = re.compile('(.+\.rpm)-[0-9A-Fa-f]{32}$')
-        for ch in cpio:
-            # ignore errors
-            if ch.filename == '.errors':
-                continue
-            # the filehandle in the cpio archive is private so
-            # open it again
-            with open(tmpfile.name, 'rb') as fh:
-                fh.seek(ch.dataoff, os.SEEK_SET)
-                h = self.readRpmHeaderFD(fh)
-                if h is None:
-                    raise FetchError("failed to read rpm header for %s"%ch.filename)
-                m = rpm_re.match(ch.filename.decode('utf-8'))
-                if m:
-                    yield m.group(1), h
-        os.unlink(tmpfile.name)
+        with NamedTemporaryFile(prefix="cpio-") as tmpfile:
+            shutil.copyfileobj(r, tmpfile, COPY_BUFSIZE)
+            tmpfile.flush()
+            if not tmpfile.tell():
+                # nothing built, and mmap refuses empty files
+                return
+            # walk the member index in the mapped file instead of reading
+            # it again, rpm reads each header from the same file
+            with mmap.mmap(tmpfile.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+                for filename, dataoff, _ in cpio_members(buf):
+                    # ignores .errors too
+                    m = rpm_re.match(filename)
+                    if not m:
+                        continue
+                    # don't bother parsing headers that are thrown away
+                    if skiprpm_re.search(m.group(1)):
+                        continue
+                    tmpfile.seek(dataoff, os.SEEK_SET)
+                    h = self.readRpmHeaderFD(tmpfile)
+                    if h is None:
+                        raise FetchError("failed to read rpm header for %s"%filename)
+                    yield m.group(1).decode('utf-8'), h
+                    del h
+
+    def _http_get(self, url):
+        """ GET an API document compressed. osc keeps the connections
+        to the API alive and decodes the response. """
+        return osc.core.http_GET(url, headers=XML_REQUEST_HEADERS)
+
+    def _get_xml(self, url):
+        """ GET url and parse it with lxml, dropping the whitespace
+        between elements as OBS pretty prints its responses """
+        return ET.parse(self._http_get(url), ET.XMLParser(remove_blank_text=True)).getroot()
 
     def _getmtimes(self, prj, pkg, repo, arch):
         """ returns a dict of filename: mtime """
         url = osc.core.makeurl(self.apiurl, ('build', prj, repo, arch, pkg))
         try:
-            root = ET.parse(osc.core.http_GET(url)).getroot()
+            root = self._get_xml(url)
         except HTTPError:
             return None
 
@@ -824,7 +1189,7 @@ class ABIChecker(ReviewBot.ReviewBot):
                     'pathproject' : tgt_project,
                     'srcmd5' : rev }
             url = osc.core.makeurl(self.apiurl, ('build', src_project, '_result'), query)
-            return ET.parse(osc.core.http_GET(url)).getroot()
+            return self._get_xml(url)
         except HTTPError as e:
             if e.code != 404:
                 self.logger.error('ERROR in URL %s [%s]' % (url, e))
@@ -848,10 +1213,25 @@ class ABIChecker(ReviewBot.ReviewBot):
 
         return repos
 
-    def get_dstrepos(self, project):
+    def _get_meta(self, project):
+        """ return the meta of project, reusing it for meta_ttl seconds.
+        Most requests of a run go to the same few projects, whose meta
+        hardly ever changes. """
+        now = time.monotonic()
+        with self.meta_lock:
+            if project in self.meta_cache:
+                fetched, root = self.meta_cache[project]
+                if now - fetched < self.meta_ttl:
+                    return root
         url = osc.core.makeurl(self.apiurl, ('source', project, '_meta'))
+        root = self._get_xml(url)
+        with self.meta_lock:
+            self.meta_cache[project] = (now, root)
+        return root
+
+    def get_dstrepos(self, project):
         try:
-            root = ET.parse(osc.core.http_GET(url)).getroot()
+            root = self._get_meta(project)
         except HTTPError:
             return None
 
@@ -880,8 +1260,8 @@ class ABIChecker(ReviewBot.ReviewBot):
         rmap = dict()
         results = osc.core.get_package_results(self.apiurl,
                 src_project, src_srcinfo.package,
-                repository = [ mr.srcrepo for mr in matchrepos],
-                arch = [ mr.arch for mr in matchrepos])
+                repository = sorted({ mr.srcrepo for mr in matchrepos }),
+                arch = sorted({ mr.arch for mr in matchrepos }))
         for result in results:
             for res, _ in osc.core.result_xml_to_dicts(result):
                 if 'package' not in res or res['package'] != src_srcinfo.package:
@@ -904,44 +1284,28 @@ class ABIChecker(ReviewBot.ReviewBot):
 
     def findrepos(self, src_project, src_srcinfo, dst_project, dst_srcinfo):
 
+        # both metas are needed, fetch them at the same time
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            dstrepos = executor.submit(self.get_dstrepos, dst_project)
+            srcmeta = executor.submit(self._get_meta, src_project)
+
         # get target repos that had a successful build
-        dstrepos = self.get_dstrepos(dst_project)
+        dstrepos = dstrepos.result()
         if dstrepos is None:
             return None
 
-        url = osc.core.makeurl(self.apiurl, ('source', src_project, '_meta'))
         try:
-            root = ET.parse(osc.core.http_GET(url)).getroot()
+            root = srcmeta.result()
         except HTTPError:
             return None
 
         # set of source repo name, target repo name, arch
-        matchrepos = set()
         # XXX: another staging hack
         if self.current_request.staging_project:
-            for node in root.findall("repository[@name='standard']/arch"):
-                arch = node.text
-                self.logger.debug('arch %s', arch)
-                matchrepos.add(MR('standard', 'standard', arch))
+            matchrepos = {MR('standard', 'standard', node.text)
+                          for node in root.findall("repository[@name='standard']/arch")}
         else:
-            for repo in root.findall('repository'):
-                name = repo.attrib['name']
-                path = repo.findall('path')
-                if path is None or len(path) != 1:
-                    self.logger.error("repo %s has more than one path"%name)
-                    continue
-                prj = path[0].attrib['project']
-                if prj == 'openSUSE:Tumbleweed':
-                    prj = 'openSUSE:Factory' # XXX: hack
-                if prj != dst_project:
-                    continue
-                for node in repo.findall('arch'):
-                    arch = node.text
-                    dstname = path[0].attrib['repository']
-                    if prj == 'openSUSE:Factory' and dstname == 'snapshot':
-                        dstname = 'standard' # XXX: hack
-                    if (dstname, arch) in dstrepos:
-                        matchrepos.add(MR(name, dstname, arch))
+            matchrepos = self._match_repos(root, dst_project, dstrepos)
 
         if not matchrepos:
             return None
@@ -957,13 +1321,35 @@ class ABIChecker(ReviewBot.ReviewBot):
             raise NotReadyYet(src_project, src_srcinfo.package, "no build success")
         if not srcrepos:
             raise NoBuildSuccess(src_project, src_srcinfo.package, src_srcinfo.verifymd5)
-        for mr in matchrepos:
-            if not (mr.srcrepo, arch) in srcrepos:
-                self.logger.error("%s/%s had no build success"%(mr.srcrepo, arch))
-                raise NoBuildSuccess(src_project, src_srcinfo.package, src_srcinfo.verifymd5)
+        missing = sorted({(mr.srcrepo, mr.arch) for mr in matchrepos} - srcrepos)
+        if missing:
+            self.logger.error("%s had no build success"%', '.join('%s/%s'%r for r in missing))
+            raise NoBuildSuccess(src_project, src_srcinfo.package, src_srcinfo.verifymd5, missing)
 
         return matchrepos
 
+    def _match_repos(self, root, dst_project, dstrepos):
+        """ match the repositories of the source project meta root that
+        build against dst_project to the target repos in dstrepos """
+        matchrepos = set()
+        for repo in root.iterfind('repository'):
+            name = repo.get('name')
+            path = repo.findall('path')
+            if len(path) != 1:
+                self.logger.error("repo %s has more than one path"%name)
+                continue
+            prj = path[0].get('project')
+            prj = REPO_PROJECT_ALIASES.get(prj, prj) # XXX: hack
+            if prj != dst_project:
+                continue
+            # the target repo is the same for all arches
+            dstname = path[0].get('repository')
+            if prj == 'openSUSE:Factory' and dstname == 'snapshot':
+                dstname = 'standard' # XXX: hack
+            matchrepos.update(MR(name, dstname, node.text) for node in repo.iterfind('arch')
+                              if (dstname, node.text) in dstrepos)
+        return matchrepos
+
     # common with repochecker
     def _md5_disturl(self, disturl):
         """Get the md5 from the DISTURL from a RPM file."""
@@ -979,16 +1365,45 @@ class ABIChecker(ReviewBot.ReviewBot):
     # belongs to that md5.
     def disturl_matches(self, disturl, prj, srcinfo):
         md5 = self._md5_disturl(disturl)
-        info = self.get_sourceinfo(prj, srcinfo.package, rev = md5)
+        verifymd5 = self._get_verifymd5(prj, srcinfo.package, md5)
         self.logger.debug(pformat(srcinfo))
-        self.logger.debug(pformat(info))
-        if info.verifymd5 == srcinfo.verifymd5:
+        self.logger.debug('verifymd5 of %s: %s', md5, verifymd5)
+        if verifymd5 == srcinfo.verifymd5:
             return True
         return False
 
+    def _get_verifymd5(self, prj, package, md5):
+        # all binaries of a build share the md5 and the verifymd5 of a
+        # revision never changes, so it can be kept for the whole run
+        key = (prj, package, md5)
+        # parallel lookups of the same build wait for the future of the
+        # first one instead of repeating it, other builds don't wait
+        with self.verifymd5_lock:
+            future = self.verifymd5_cache.get(key)
+            lookup = future is None
+            if lookup:
+                future = self.verifymd5_cache[key] = Future()
+        if lookup:
+            try:
+                info = self.get_sourceinfo(prj, package, rev = md5)
+            except BaseException as e:
+                with self.verifymd5_lock:
+                    del self.verifymd5_cache[key]
+                future.set_exception(e)
+                raise
+            if info is None:
+                # look again next time
+                with self.verifymd5_lock:
+                    del self.verifymd5_cache[key]
+                future.set_result(None)
+            else:
+                future.set_result(info.verifymd5)
+        return future.result()
+
     def compute_fetchlist(self, prj, pkg, srcinfo, repo, arch):
         """ scan binary rpms of the specified repo for libraries.
-        Returns a set of packages to fetch and the libraries found
+        Returns a dict of packages to fetch with the files to extract
+        from each and the libraries found
         """
         self.logger.debug('scanning %s/%s %s/%s'%(prj, pkg, repo, arch))
 
@@ -996,36 +1411,29 @@ class ABIChecker(ReviewBot.ReviewBot):
         missing_debuginfo = set()
         lib_packages = dict() # pkgname -> set(lib file names)
         pkgs = dict() # pkgname -> cpiohdr, rpmhdr
+        pkgclasses = dict() # pkgname -> PkgClass
         lib_aliases = dict()
-        for rpmfn, h in headers:
-            # skip src rpm
-            if h['sourcepackage']:
-                continue
-            pkgname = h['name'].decode('utf-8')
-            if pkgname.endswith('-32bit') or pkgname.endswith('-64bit'):
-                # -32bit and -64bit packages are just repackaged, so
-                # we skip them and only check the original one.
+        # the disturl check may have to ask OBS and the file list scan
+        # is independent for each package, so inspect them in parallel
+        with ThreadPoolExecutor(max_workers=self.download_workers) as executor:
+            futures = [executor.submit(self._inspect_header, rpmfn, h, prj, srcinfo) for rpmfn, h in headers]
+            results = [f.result() for f in futures]
+        for result in results:
+            if result is None:
                 continue
-            self.logger.debug("inspecting %s", pkgname)
-            if not self.disturl_matches(h['disturl'].decode('utf-8'), prj, srcinfo):
-                raise DistUrlMismatch(h['disturl'].decode('utf-8'), srcinfo)
+            pkgname, rpmfn, h, pkgclass = result
             pkgs[pkgname] = (rpmfn, h)
-            if debugpkg_re.match(pkgname):
-                continue
-            for fn, mode, lnk in zip(h['filenames'], h['filemodes'], h['filelinktos']):
-                fn = fn.decode('utf-8')
-                lnk = lnk.decode('utf-8')
-                if so_re.match(fn):
-                    if S_ISREG(mode):
-                        self.logger.debug('found lib: %s'%fn)
-                        lib_packages.setdefault(pkgname, set()).add(fn)
-                    elif S_ISLNK(mode) and lnk is not None:
-                        alias = os.path.basename(fn)
-                        libname = os.path.basename(lnk)
-                        self.logger.debug('found alias: %s -> %s'%(alias, libname))
-                        lib_aliases.setdefault(libname, set()).add(alias)
-
-        fetchlist = set()
+            pkgclasses[pkgname] = pkgclass
+            for fn in pkgclass.libs:
+                self.logger.debug('found lib: %s'%fn)
+                lib_packages.setdefault(pkgname, set()).add(fn)
+            for alias, libname in pkgclass.aliases:
+                self.logger.debug('found alias: %s -> %s'%(alias, libname))
+                lib_aliases.setdefault(libname, set()).add(alias)
+        with self.pkgclass_lock:
+            self.pkgclass_cache.sync()
+
+        fetchlist = dict()
         liblist = dict()
         debuglist = dict()
         # check whether debug info exists for each lib
@@ -1037,34 +1445,39 @@ class ABIChecker(ReviewBot.ReviewBot):
 
             # check file list of debuginfo package
             rpmfn, h = pkgs[dpkgname]
-            files = set ([f.decode('utf-8') for f in h['filenames']])
-            ok = True
-            for lib in lib_packages[pkgname]:
-                libdebug = '/usr/lib/debug%s.debug'%lib
-                if libdebug not in files:
-                    # some new format that includes version, release and arch in debuginfo?
-                    # FIXME: version and release are actually the
-                    # one from the main package, sub packages may
-                    # differ. BROKEN RIGHT NOW
-                    # XXX: would have to actually read debuglink
-                    # info to get that right so just guessing
-                    arch = h['arch'].decode('utf-8')
-                    if arch == 'i586':
-                        arch = 'i386'
-                    libdebug = '/usr/lib/debug%s-%s-%s.%s.debug'%(lib,
-                            h['version'].decode('utf-8'), h['release'].decode('utf-8'), arch)
+            files = pkgclasses[dpkgname].debugfiles
+            debugpaths = {lib: '/usr/lib/debug' + lib + '.debug' for lib in lib_packages[pkgname]}
+            unversioned = [lib for lib, libdebug in debugpaths.items() if libdebug not in files]
+            if unversioned:
+                # some new format that includes version, release and arch in debuginfo?
+                # FIXME: version and release are actually the
+                # one from the main package, sub packages may
+                # differ. BROKEN RIGHT NOW
+                # XXX: would have to actually read debuglink
+                # info to get that right so just guessing
+                darch = h['arch'].decode('utf-8')
+                if darch == 'i586':
+                    darch = 'i386'
+                versioned_suffix = '-%s-%s.%s.debug'%(h['version'].decode('utf-8'),
+                        h['release'].decode('utf-8'), darch)
+                ok = True
+                for lib in unversioned:
+                    libdebug = '/usr/lib/debug' + lib + versioned_suffix
                     if libdebug not in files:
                         missing_debuginfo.add((prj, pkg, repo, arch, pkgname, lib))
                         ok = False
+                    debugpaths[lib] = libdebug
+                if not ok:
+                    continue
 
-                if ok:
-                    fetchlist.add(pkgs[pkgname][0])
-                    fetchlist.add(rpmfn)
-                    liblist.setdefault(lib, set())
-                    debuglist.setdefault(lib, libdebug)
-                    libname = os.path.basename(lib)
-                    if libname in lib_aliases:
-                        liblist[lib] |= lib_aliases[libname]
+            for lib, libdebug in debugpaths.items():
+                fetchlist.setdefault(pkgs[pkgname][0], set()).add(lib)
+                fetchlist.setdefault(rpmfn, set()).add(libdebug)
+                liblist.setdefault(lib, set())
+                debuglist.setdefault(lib, libdebug)
+                libname = os.path.basename(lib)
+                if libname in lib_aliases:
+                    liblist[lib] |= lib_aliases[libname]
 
         if missing_debuginfo:
             self.logger.error('missing debuginfo: %s'%pformat(missing_debuginfo))
@@ -1072,6 +1485,69 @@ class ABIChecker(ReviewBot.ReviewBot):
 
         return fetchlist, liblist, debuglist
 
+    def _inspect_header(self, rpmfn, h, prj, srcinfo):
+        """ check that the binary was built from srcinfo and classify it.
+        Returns a (pkgname, rpmfn, h, pkgclass) tuple or None if the
+        package is not to be checked.
+        """
+        # skip src rpm
+        if h['sourcepackage']:
+            return None
+        pkgname = h['name'].decode('utf-8')
+        if pkgname.endswith('-32bit') or pkgname.endswith('-64bit'):
+            # -32bit and -64bit packages are just repackaged, so
+            # we skip them and only check the original one.
+            return None
+        self.logger.debug("inspecting %s", pkgname)
+        if not self.disturl_matches(h['disturl'].decode('utf-8'), prj, srcinfo):
+            raise DistUrlMismatch(h['disturl'].decode('utf-8'), srcinfo)
+        return pkgname, rpmfn, h, self.classify_package(rpmfn, h)
+
+    def classify_package(self, rpmfn, h):
+        """ find libraries and their aliases, or the debug files of a
+        debuginfo package. The result only depends on the contents of
+        the package so it's cached by disturl and file name.
+        """
+        key = '%s/%s'%(h['disturl'].decode('utf-8'), rpmfn)
+        with self.pkgclass_lock:
+            try:
+                if key in self.pkgclass_cache:
+                    return PkgClass(*self.pkgclass_cache[key])
+            except (AttributeError, ImportError):
+                # written by an older version, classify again
+                pass
+
+        libs = set()
+        aliases = set()
+        debugfiles = set()
+        if is_debugpkg(h['name'].decode('utf-8')):
+            for fn in h['filenames']:
+                if fn.startswith(b'/usr/lib/debug/') and fn.endswith(b'.debug'):
+                    debugfiles.add(fn.decode('utf-8'))
+        else:
+            # only a handful of the files are libraries, so match on the
+            # raw bytes and decode just those
+            _is_lib = is_lib
+            for fn, mode, lnk in zip(h['filenames'], h['filemodes'], h['filelinktos']):
+                if not _is_lib(fn):
+                    continue
+                if S_ISREG(mode):
+                    libs.add(fn.decode('utf-8'))
+                elif S_ISLNK(mode) and lnk:
+                    aliases.add((os.path.basename(fn.decode('utf-8')), os.path.basename(lnk.decode('utf-8'))))
+
+        pkgclass = PkgClass(frozenset(libs), frozenset(aliases), frozenset(debugfiles))
+        with self.pkgclass_lock:
+            if len(self.pkgclass_cache) >= PKGCLASS_SLOTS:
+                self.pkgclass_cache.clear()
+            self.pkgclass_cache[key] = tuple(pkgclass)
+        return pkgclass
+
+    def close_pkgclass_cache(self):
+        """ write out and close the package classification cache """
+        with self.pkgclass_lock:
+            self.pkgclass_cache.close()
+
 class CommandLineInterface(ReviewBot.CommandLineInterface):
 
     def __init__(self, *args, **kwargs):
@@ -1083,6 +1559,10 @@ class CommandLineInterface(ReviewBot.CommandLineInterface):
         parser.add_option("--force", action="store_true", help="recheck requests that are already considered done")
         parser.add_option("--no-review", action="store_true", help="don't actually accept or decline, just comment")
         parser.add_option("--web-url", metavar="URL", help="URL of web service")
+        parser.add_option("--download-workers", metavar="NUM", type="int", default=DOWNLOAD_WORKERS,
+                          help="number of binary packages to download in parallel (default: %d)"%DOWNLOAD_WORKERS)
+        parser.add_option("--meta-ttl", metavar="SECONDS", type="int", default=META_TTL,
+                          help="seconds to reuse a fetched project meta, 0 to always fetch (default: %d)"%META_TTL)
         return parser
 
     def postoptparse(self):
@@ -1102,6 +1582,8 @@ class CommandLineInterface(ReviewBot.CommandLineInterface):
             bot.no_review = True
         if self.options.force:
             bot.force = True
+        bot.download_workers = max(1, self.options.download_workers)
+        bot.meta_ttl = self.options.meta_ttl
 
         return bot
 
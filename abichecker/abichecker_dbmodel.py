@@ -3,11 +3,11 @@
 import os
 import sys
 from datetime import datetime
-from sqlalchemy import Column, ForeignKey, Integer, String, Boolean, DateTime, Text
+from sqlalchemy import Column, ForeignKey, Index, Integer, String, Boolean, DateTime, Text
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship, backref
-from sqlalchemy.orm import sessionmaker
-from sqlalchemy import create_engine
+from sqlalchemy.orm import scoped_session, sessionmaker
+from sqlalchemy import create_engine, event
 
 from abichecker_common import DATADIR
 
@@ -25,7 +25,7 @@ class Request(Base):
 class Log(Base):
     __tablename__ = 'log'
     id = Column(Integer, primary_key=True)
-    request_id = Column(Integer, ForeignKey('request.id'), nullable=False)
+    request_id = Column(Integer, ForeignKey('request.id'), nullable=False, index=True)
     request = relationship(Request, backref=backref('log', order_by=id, cascade="all, delete-orphan"))
     line = Column(Text(), nullable=True)
 
@@ -34,7 +34,7 @@ class Log(Base):
 class ABICheck(Base):
     __tablename__ = 'abicheck'
     id = Column(Integer, primary_key=True)
-    request_id = Column(Integer, ForeignKey('request.id'), nullable=False)
+    request_id = Column(Integer, ForeignKey('request.id'), nullable=False, index=True)
     request = relationship(Request, backref=backref('abichecks', order_by=id, cascade="all, delete-orphan"))
 
     src_project = Column(String(255), nullable=False)
@@ -50,7 +50,7 @@ class ABICheck(Base):
 class LibReport(Base):
     __tablename__ = 'libreport'
     id = Column(Integer, primary_key=True)
-    submission_id = Column(Integer, ForeignKey('abicheck.id'), nullable=False)
+    submission_id = Column(Integer, ForeignKey('abicheck.id'), nullable=False, index=True)
     abicheck = relationship(ABICheck, backref=backref('reports', order_by=id, cascade="all, delete-orphan"))
 
     src_repo = Column(String(255), nullable=False)
@@ -64,6 +64,8 @@ class LibReport(Base):
     t_created = Column(DateTime, default=datetime.now)
     t_updated = Column(DateTime, default=datetime.now, onupdate=datetime.now)
 
+    __table_args__ = (Index('ix_libreport_abi_arch', 'submission_id', 'arch'),)
+
 class Config(Base):
     __tablename__ = 'config'
     id = Column(Integer, primary_key=True)
@@ -73,11 +75,47 @@ class Config(Base):
     t_created = Column(DateTime, default=datetime.now)
     t_updated = Column(DateTime, default=datetime.now, onupdate=datetime.now)
 
+def bulk_add_reports(session, reports):
+    """ insert LibReport rows given as dicts in one go. The ids of the
+    new rows are stored in the dicts. """
+    session.bulk_insert_mappings(LibReport, reports, return_defaults=True)
+
+def _sqlite_pragmas(dbapi_connection, connection_record):
+    # WAL avoids a fsync of the whole database for every commit and
+    # lets the web interface read while the checker writes
+    cursor = dbapi_connection.cursor()
+    cursor.execute('PRAGMA journal_mode=WAL')
+    cursor.execute('PRAGMA synchronous=NORMAL')
+    cursor.execute('PRAGMA temp_store=MEMORY')
+    cursor.execute('PRAGMA cache_size=-65536')
+    cursor.close()
+
+_ENGINE = None
+_SESSION = None
+
 def db_engine():
-    return create_engine('sqlite:///%s/abi-checker.db'%DATADIR)
+    global _ENGINE
+    if _ENGINE is None:
+        _ENGINE = create_engine('sqlite:///%s/abi-checker.db'%DATADIR,
+                connect_args={'check_same_thread': False})
+        event.listen(_ENGINE, 'connect', _sqlite_pragmas)
+    return _ENGINE
+
+def db_create():
+    engine = db_engine()
+    Base.metadata.create_all(engine)
+    # create_all() does not add new indexes to existing tables
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(engine, checkfirst=True)
 
 def db_session():
-    engine = db_engine()
-    Base.metadata.bind = engine
-    DBSession = sessionmaker(bind=engine)
-    return DBSession()
+    """ the session registry shared by all users. The checker works with
+    threads, each one gets its own session from it and has to remove()
+    it when done """
+    global _SESSION
+    if _SESSION is None:
+        engine = db_engine()
+        Base.metadata.bind = engine
+        _SESSION = scoped_session(sessionmaker(bind=engine))
+    return _SESSION
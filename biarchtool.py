@@ -1,5 +1,8 @@
 #!/usr/bin/python3
 
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
 from lxml import etree as ET
 import sys
 import cmdln
@@ -11,6 +14,15 @@ import ToolBase
 logger = logging.getLogger()
 
 FACTORY = "openSUSE:Factory"
+# number of file lists to fetch in parallel
+FETCH_WORKERS = 16
+# number of package metas to update in parallel
+UPDATE_WORKERS = 8
+
+# queries for the build flags and results of an arch, compiled once
+build_enable_xpath = ET.XPath('./build/enable[@arch=$arch]')
+build_disable_xpath = ET.XPath('./build/disable[@arch=$arch]')
+result_status_xpath = ET.XPath('./result[@arch=$arch]/status')
 
 
 class BiArchTool(ToolBase.ToolBase):
@@ -20,10 +32,14 @@ class BiArchTool(ToolBase.ToolBase):
         self.project = project
         self.biarch_packages = None
         self._has_baselibs = dict()
+        self._srcpkg_baselibs = dict()
+        self._is_biarch = dict()
         self.packages = []
         self.arch = 'i586'
         self.rdeps = None
         self.package_metas = dict()
+        # packages with an explicit enable for arch
+        self.packages_with_enable = set()
         self.whitelist = {
             'i586': set([
                 'bzr',
@@ -66,42 +82,95 @@ class BiArchTool(ToolBase.ToolBase):
             srcpkgname = package.split(':')[0]
 
         ret = False
-        files = self.get_filelist(self.project, srcpkgname)
-        if 'baselibs.conf' in files:
+        has_baselibs, link_has_baselibs = self._find_baselibs(srcpkgname)
+        if has_baselibs:
             logger.debug('%s has baselibs', package)
             if is_multibuild:
                 logger.warning('%s is multibuild and has baselibs. canot handle that!', package)
             else:
                 ret = True
-        elif '_link' in files:
-            files = self.get_filelist(self.project, srcpkgname, expand=True)
-            if 'baselibs.conf' in files:
-                logger.warning('%s is linked to a baselibs package', package)
+        elif link_has_baselibs:
+            logger.warning('%s is linked to a baselibs package', package)
         elif is_multibuild:
             logger.warning('%s is multibuild', package)
         self._has_baselibs[package] = ret
         return ret
 
+    def _find_baselibs(self, srcpkgname):
+        """returns whether the source package has a baselibs.conf and
+        whether its link target has one. All multibuild flavors share
+        the answer."""
+        if srcpkgname not in self._srcpkg_baselibs:
+            link_has_baselibs = False
+            files = self.get_filelist(self.project, srcpkgname)
+            has_baselibs = 'baselibs.conf' in files
+            if not has_baselibs and '_link' in files:
+                files = self.get_filelist(self.project, srcpkgname, expand=True)
+                link_has_baselibs = 'baselibs.conf' in files
+            self._srcpkg_baselibs[srcpkgname] = (has_baselibs, link_has_baselibs)
+        return self._srcpkg_baselibs[srcpkgname]
+
+    def prefetch_baselibs(self, packages):
+        """look up has_baselibs() for packages in parallel"""
+        if self.caching:
+            # the request cache is locked for the whole of each GET, the
+            # lookups would only queue up on it
+            return
+        todo = [p for p in set(packages) if p not in self._has_baselibs
+                and p not in self.arch_blacklist
+                and p not in self.biarch_packages
+                and p not in self.arch_whitelist]
+        if not todo:
+            return
+        logger.debug('fetching file lists of %d packages', len(todo))
+        with ThreadPoolExecutor(max_workers=FETCH_WORKERS) as executor:
+            for _ in executor.map(self.has_baselibs, todo):
+                pass
+
     def is_biarch_recursive(self, package):
+        """a package is biarch if it or a package that requires it for
+        build is known to be biarch or has baselibs. Walks the reverse
+        dependencies breadth first so the nearest answer is found with
+        the fewest has_baselibs() lookups."""
+        parents = {package: None}
+        queue = deque([package])
+        while queue:
+            pkg = queue.popleft()
+            r = self._is_biarch_package(pkg)
+            if r is None:
+                for p in self.rdeps.get(pkg, ()):
+                    if p not in parents:
+                        parents[p] = pkg
+                        queue.append(p)
+            elif r:
+                # everything on the way to a biarch package is biarch too
+                while pkg is not None:
+                    self._is_biarch[pkg] = True
+                    pkg = parents[pkg]
+                return True
+        # nothing reachable is biarch
+        for pkg in parents:
+            self._is_biarch[pkg] = False
+        return False
+
+    def _is_biarch_package(self, package):
+        """returns whether package itself decides about biarch, None if
+        its reverse dependencies have to be looked at"""
+        if package in self._is_biarch:
+            return self._is_biarch[package]
         logger.debug(package)
-        if package in self.blacklist[self.arch]:
+        if package in self.arch_blacklist:
             logger.debug('%s is blacklisted', package)
             return False
         if package in self.biarch_packages:
             logger.debug('%s is known biarch package', package)
             return True
-        if package in self.whitelist[self.arch]:
+        if package in self.arch_whitelist:
             logger.debug('%s is whitelisted', package)
             return True
-        r = self.has_baselibs(package)
-        if r:
-            return r
-        if package in self.rdeps:
-            for p in self.rdeps[package]:
-                r = self.is_biarch_recursive(p)
-                if r:
-                    break
-        return r
+        if self.has_baselibs(package):
+            return True
+        return None
 
     def _init_biarch_packages(self):
         if self.biarch_packages is None:
@@ -111,30 +180,53 @@ class BiArchTool(ToolBase.ToolBase):
                 self.biarch_packages = set(self.meta_get_packagelist("%s:Rings:0-Bootstrap" % self.project))
                 self.biarch_packages |= set(self.meta_get_packagelist("%s:Rings:1-MinimalX" % self.project))
 
+        # the lists of the arch, looked up for every visited package
+        self.arch_blacklist = frozenset(self.blacklist.get(self.arch, ()))
+        self.arch_whitelist = frozenset(self.whitelist.get(self.arch, ()))
+
         self._init_rdeps()
         self.fill_package_meta()
 
+    def _package_search_url(self):
+        return self.makeurl(['search', 'package'], "match=[@project='%s']" % self.project)
+
     def fill_package_meta(self):
-        url = self.makeurl(['search', 'package'], "match=[@project='%s']" % self.project)
-        root = ET.fromstring(self.cached_GET(url))
-        for p in root.findall('package'):
+        url = self._package_search_url()
+        self.packages_with_enable = set()
+        # keep the metas serialized rather than as one big tree, only
+        # the packages that are looked at get parsed again
+        for _, p in ET.iterparse(BytesIO(self.cached_GET(url)), tag='package'):
             name = p.attrib['name']
-            self.package_metas[name] = p
+            self.package_metas[name] = ET.tostring(p, with_tail=False)
+            if build_enable_xpath(p, arch=self.arch):
+                self.packages_with_enable.add(name)
+            p.clear()
+            while p.getprevious() is not None:
+                del p.getparent()[0]
+
+    def get_package_meta(self, package):
+        return ET.fromstring(self.package_metas[package])
 
     def _init_rdeps(self):
         if self.rdeps is not None:
             return
         self.rdeps = dict()
         url = self.makeurl(['build', self.project, 'standard', self.arch, '_builddepinfo'], {'view': 'revpkgnames'})
-        x = ET.fromstring(self.cached_GET(url))
-        for pnode in x.findall('package'):
+        # only the names are needed, so don't keep the whole tree around
+        for _, pnode in ET.iterparse(BytesIO(self.cached_GET(url)), tag='package'):
             name = pnode.get('name')
-            for depnode in pnode.findall('pkgdep'):
+            deps = set()
+            for depnode in pnode.iterfind('pkgdep'):
                 depname = depnode.text
                 if depname == name:
                     logger.warning('%s requires itself for build', name)
                     continue
-                self.rdeps.setdefault(name, set()).add(depname)
+                deps.add(depname)
+            if deps:
+                self.rdeps.setdefault(name, set()).update(deps)
+            pnode.clear()
+            while pnode.getprevious() is not None:
+                del pnode.getparent()[0]
 
     def select_packages(self, packages):
         if packages == '__all__':
@@ -153,10 +245,11 @@ class BiArchTool(ToolBase.ToolBase):
 
         packages = set()
 
-        for n in result.findall("./result[@arch='{}']/status".format(self.arch)):
+        for n in result_status_xpath(result, arch=self.arch):
             if n.get('code') not in ('disabled', 'excluded'):
                 packages.add(n.get('package'))
 
+        todo = dict()
         for pkg in sorted(packages):
             changed = False
 
@@ -164,27 +257,25 @@ class BiArchTool(ToolBase.ToolBase):
             if pkg not in self.package_metas:
                 logger.error("%s not found", pkg)
                 continue
-            pkgmeta = self.package_metas[pkg]
+            if pkg not in self.packages_with_enable:
+                continue
+            pkgmeta = self.get_package_meta(pkg)
 
-            for build in pkgmeta.findall("./build"):
-                for n in build.findall("./enable[@arch='{}']".format(self.arch)):
-                    logger.debug("disable %s", pkg)
-                    build.remove(n)
-                    changed = True
+            for n in build_enable_xpath(pkgmeta, arch=self.arch):
+                logger.debug("disable %s", pkg)
+                n.getparent().remove(n)
+                changed = True
 
             if changed:
-                try:
-                    pkgmetaurl = self.makeurl(['source', self.project, pkg, '_meta'])
-                    self.http_PUT(pkgmetaurl, data=ET.tostring(pkgmeta))
-                    if self.caching:
-                        self._invalidate__cached_GET(pkgmetaurl)
-                except HTTPError as e:
-                    logger.error('failed to update %s: %s', pkg, e)
+                todo[pkg] = pkgmeta
+
+        self.apply_package_metas(todo)
 
     def add_explicit_disable(self, wipebinaries=False):
 
         self._init_biarch_packages()
 
+        todo = dict()
         for pkg in self.packages:
 
             changed = False
@@ -193,7 +284,7 @@ class BiArchTool(ToolBase.ToolBase):
             if pkg not in self.package_metas:
                 logger.error("%s not found", pkg)
                 continue
-            pkgmeta = self.package_metas[pkg]
+            pkgmeta = self.get_package_meta(pkg)
 
             build = pkgmeta.findall("./build")
             if not build:
@@ -205,38 +296,38 @@ class BiArchTool(ToolBase.ToolBase):
                 changed = True
 
             if changed:
-                try:
-                    pkgmetaurl = self.makeurl(['source', self.project, pkg, '_meta'])
-                    self.http_PUT(pkgmetaurl, data=ET.tostring(pkgmeta))
-                    if self.caching:
-                        self._invalidate__cached_GET(pkgmetaurl)
-                    if wipebinaries:
-                        self.http_POST(self.makeurl(['build', self.project], {
-                            'cmd': 'wipe',
-                            'arch': self.arch,
-                            'package': pkg}))
-                except HTTPError as e:
-                    logger.error('failed to update %s: %s', pkg, e)
+                todo[pkg] = pkgmeta
+
+        self.apply_package_metas(todo, wipebinaries)
 
     def enable_baselibs_packages(self, force=False, wipebinaries=False):
         self._init_biarch_packages()
+        if not force:
+            self.prefetch_baselibs(p for p in self.packages if p in self.package_metas)
         todo = dict()
         for pkg in self.packages:
             logger.debug("processing %s", pkg)
             if pkg not in self.package_metas:
                 logger.error("%s not found", pkg)
                 continue
-            pkgmeta = self.package_metas[pkg]
+            pkgmeta = self.get_package_meta(pkg)
 
-            is_enabled = None
-            is_disabled = None
             must_disable = None
             changed = None
 
-            for n in pkgmeta.findall("./build/enable[@arch='{}']".format(self.arch)):
-                is_enabled = True
-            for n in pkgmeta.findall("./build/disable[@arch='{}']".format(self.arch)):
-                is_disabled = True
+            # (build, flag) pairs of the enable and disable flags for arch
+            enables = []
+            disables = []
+            for build in pkgmeta.iterfind('build'):
+                for n in build:
+                    if n.get('arch') != self.arch:
+                        continue
+                    if n.tag == 'enable':
+                        enables.append((build, n))
+                    elif n.tag == 'disable':
+                        disables.append((build, n))
+            is_enabled = bool(enables)
+            is_disabled = bool(disables)
 
             if force:
                 must_disable = False
@@ -250,10 +341,9 @@ class BiArchTool(ToolBase.ToolBase):
             if not must_disable:
                 if is_disabled:
                     logger.info('enabling %s for %s', pkg, self.arch)
-                    for build in pkgmeta.findall("./build"):
-                        for n in build.findall("./disable[@arch='{}']".format(self.arch)):
-                            build.remove(n)
-                            changed = True
+                    for build, n in disables:
+                        build.remove(n)
+                        changed = True
                     if not changed:
                         logger.error('build tag not found in %s/%s!?', pkg, self.arch)
                 else:
@@ -271,10 +361,9 @@ class BiArchTool(ToolBase.ToolBase):
 
             if is_enabled:
                 logger.info('removing explicit enable %s for %s', pkg, self.arch)
-                for build in pkgmeta.findall("./build"):
-                    for n in build.findall("./enable[@arch='{}']".format(self.arch)):
-                        build.remove(n)
-                        changed = True
+                for build, n in enables:
+                    build.remove(n)
+                    changed = True
                 if not changed:
                     logger.error('build tag not found in %s/%s!?', pkg, self.arch)
 
@@ -283,22 +372,36 @@ class BiArchTool(ToolBase.ToolBase):
 
         if todo:
             logger.info("applying changes")
-        for pkg in sorted(todo.keys()):
-            pkgmeta = todo[pkg]
-            try:
-                pkgmetaurl = self.makeurl(['source', self.project, pkg, '_meta'])
-                self.http_PUT(pkgmetaurl, data=ET.tostring(pkgmeta))
-                if self.caching:
-                    self._invalidate__cached_GET(pkgmetaurl)
-
-                if wipebinaries and pkgmeta.find("./build/disable[@arch='{}']".format(self.arch)) is not None:
-                    logger.debug("wiping %s", pkg)
-                    self.http_POST(self.makeurl(['build', self.project], {
-                        'cmd': 'wipe',
-                        'arch': self.arch,
-                        'package': pkg}))
-            except HTTPError as e:
-                logger.error('failed to update %s: %s', pkg, e)
+        self.apply_package_metas(todo, wipebinaries)
+
+    def apply_package_metas(self, todo, wipebinaries=False):
+        """store the changed package metas in todo, several at a time"""
+        with ThreadPoolExecutor(max_workers=UPDATE_WORKERS) as executor:
+            futures = {pkg: executor.submit(self._apply_package_meta, pkg, pkgmeta,
+                                            wipebinaries and bool(build_disable_xpath(pkgmeta, arch=self.arch)))
+                       for pkg, pkgmeta in todo.items()}
+            # report in a stable order
+            for pkg in sorted(futures):
+                try:
+                    futures[pkg].result()
+                except HTTPError as e:
+                    logger.error('failed to update %s: %s', pkg, e)
+
+        # the metas are only ever read through the project wide search, so
+        # drop that once after all updates rather than per package
+        if self.caching and todo:
+            self._invalidate__cached_GET(self._package_search_url())
+
+    def _apply_package_meta(self, pkg, pkgmeta, wipe):
+        pkgmetaurl = self.makeurl(['source', self.project, pkg, '_meta'])
+        self.http_PUT(pkgmetaurl, data=ET.tostring(pkgmeta))
+
+        if wipe:
+            logger.debug("wiping %s", pkg)
+            self.http_POST(self.makeurl(['build', self.project], {
+                'cmd': 'wipe',
+                'arch': self.arch,
+                'package': pkg}))
 
 
 class CommandLineInterface(ToolBase.CommandLineInterface):
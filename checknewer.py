@@ -4,7 +4,6 @@
 from __future__ import print_function
 
 import sys
-import re
 import solv
 
 pool = solv.Pool()
@@ -23,37 +22,44 @@ for arg in args:
     repo = pool.add_repo(arg)
     if not firstrepo:
         firstrepo = repo
-    if re.search(r'solv$', arg):
+    if arg.endswith('solv'):
         repo.add_solv(argf)
-    elif re.search(r'primary\.xml', arg):
+    elif 'primary.xml' in arg:
         repo.add_rpmmd(argf, None)
-    elif re.search(r'packages', arg):
+    elif 'packages' in arg:
         repo.add_susetags(argf, 0, None)
     else:
         print("%s: unknown repo type" % (arg))
         sys.exit(1)
 
-# we only want self-provides
+# index the binaries of the other repos by name. Comparing their EVR
+# directly replaces overriding the provides with self-provides and a
+# whatprovides lookup per package.
+# each attribute access goes through the bindings, so the arch of
+# the candidates is stored along with them
+ARCH_NOARCH = solv.ARCH_NOARCH
+ARCH_SOURCES = (solv.ARCH_SRC, solv.ARCH_NOSRC)
+others = {}
 for p in pool.solvables:
-    if p.archid == solv.ARCH_SRC or p.archid == solv.ARCH_NOSRC:
+    if p.repo == firstrepo:
         continue
-    selfprovides = pool.rel2id(p.nameid, p.evrid, solv.REL_EQ)
-    p.unset(solv.SOLVABLE_PROVIDES)
-    p.add_deparray(solv.SOLVABLE_PROVIDES, selfprovides)
-
-pool.createwhatprovides()
+    archid = p.archid
+    if archid in ARCH_SOURCES:
+        continue
+    others.setdefault(p.nameid, []).append((p, archid))
 
 for p in firstrepo.solvables:
-    newerdep = pool.rel2id(p.nameid, p.evrid, solv.REL_GT | solv.REL_EQ)
-    for pp in pool.whatprovides(newerdep):
-        if pp.repo == firstrepo:
+    candidates = others.get(p.nameid)
+    if not candidates:
+        continue
+    archid = p.archid
+    for pp, pparchid in candidates:
+        if archid != pparchid and archid != ARCH_NOARCH and pparchid != ARCH_NOARCH:
             continue
-        if p.nameid != pp.nameid:
+        if pp.evrcmp(p) < 0:
             continue
         if p.identical(pp):
             continue
-        if p.archid != pp.archid and p.archid != solv.ARCH_NOARCH and pp.archid != solv.ARCH_NOARCH:
-            continue
         src = p.name
         if not p.lookup_void(solv.SOLVABLE_SOURCENAME):
             src = p.lookup_str(solv.SOLVABLE_SOURCENAME)
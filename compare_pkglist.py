@@ -3,14 +3,22 @@
 import argparse
 import logging
 import sys
+from concurrent.futures import ThreadPoolExecutor
 from urllib.error import HTTPError
 
 from lxml import etree as ET
 import osc.conf
 import osc.core
+from osclib.memoize import memoize
 
 OPENSUSE = 'openSUSE:Leap:15.2'
 SLE = 'SUSE:SLE-15-SP2:GA'
+# number of package diffs to request in parallel
+DIFF_WORKERS = 16
+# seconds to keep package lists with --cache-requests
+CACHE_TTL = 60 * 60
+# the listings and diffs are large XML documents, have them compressed
+COMPRESSED = {'Accept-Encoding': 'gzip'}
 
 makeurl = osc.core.makeurl
 http_GET = osc.core.http_GET
@@ -18,7 +26,8 @@ http_POST = osc.core.http_POST
 
 
 class CompareList(object):
-    def __init__(self, old_prj, new_prj, verbose, newonly, removedonly, existin, submit, submitfrom, submitto, submit_limit):
+    def __init__(self, old_prj, new_prj, verbose, newonly, removedonly, existin, submit, submitfrom, submitto, submit_limit,
+                 caching=False):
         self.new_prj = new_prj
         self.old_prj = old_prj
         self.verbose = verbose
@@ -29,14 +38,32 @@ class CompareList(object):
         self.submitto = submitto
         self.submit_limit = submit_limit
         self.removedonly = removedonly
+        self.caching = caching
+        # project -> (package -> srcmd5, package -> packages of the
+        # project linking to it)
+        self.source_infos = dict()
         self.apiurl = osc.conf.config['apiurl']
         self.debug = osc.conf.config['debug']
 
+    def __str__(self):
+        # memoize keys the cache on the first argument as string, keep it
+        # the same between runs
+        return '{}({})'.format(self.__class__.__name__, self.apiurl)
+
+    @memoize(ttl=CACHE_TTL)
+    def _cached_GET(self, url):
+        return http_GET(url, headers=COMPRESSED).read()
+
+    def cached_GET(self, url):
+        if self.caching:
+            return self._cached_GET(url)
+        return http_GET(url, headers=COMPRESSED).read()
+
     def get_source_packages(self, project):
         """Return the list of packages in a project."""
         query = {'expand': 1}
-        root = ET.parse(http_GET(makeurl(self.apiurl, ['source', project],
-                                 query=query))).getroot()
+        root = ET.fromstring(self.cached_GET(makeurl(self.apiurl, ['source', project],
+                                                     query=query)))
         packages = [i.get('name') for i in root.findall('entry')]
 
         return packages
@@ -62,22 +89,35 @@ class CompareList(object):
             apiurl = self.apiurl
         query = "match=state/@name='accepted'+and+(action/target/@project='{}'+and+action/@type='delete')".format(project)
         url = makeurl(apiurl, ['search', 'request'], query)
-        f = http_GET(url)
-        root = ET.parse(f).getroot()
+        root = ET.fromstring(self.cached_GET(url))
         packages = [t.get('package') for t in root.findall('./request/action/target')]
 
         return packages
 
+    def get_source_info(self, project):
+        """Return the srcmd5 of the packages of the project and the
+        packages each of them links to."""
+        if project in self.source_infos:
+            return self.source_infos[project]
+        query = {'view': 'info', 'nofilename': 1}
+        root = ET.fromstring(self.cached_GET(makeurl(self.apiurl, ['source', project], query=query)))
+        srcmd5s = dict()
+        links = dict()
+        for si in root.findall('sourceinfo'):
+            srcmd5s[si.get('package')] = si.get('srcmd5')
+            # <linked> names the package this one links to
+            links[si.get('package')] = {(linked.get('project'), linked.get('package'))
+                                        for linked in si.findall('linked')}
+        self.source_infos[project] = (srcmd5s, links)
+        return self.source_infos[project]
+
     def is_linked_package(self, project, package):
-        query = {'withlinked': 1}
-        u = makeurl(self.apiurl, ['source', project, package], query=query)
-        root = ET.parse(http_GET(u)).getroot()
-        links = root.findall('linkinfo/linked')
-        if links is None:
-            return False
+        # one source info listing of the project answers this for all
+        # packages rather than a request per package
+        _, links = self.get_source_info(project)
 
-        for linked in links:
-            if linked.get('project') == project and linked.get('package').startswith("%s." % package):
+        for linked_project, linked_package in links.get(package, ()):
+            if linked_project == project and linked_package.startswith("%s." % package):
                 return False
         return True
 
@@ -88,7 +128,7 @@ class CompareList(object):
                  'oproject': old_prj,
                  'opackage': package}
         u = makeurl(self.apiurl, ['source', new_prj, package], query=query)
-        root = ET.parse(http_POST(u)).getroot()
+        root = ET.parse(http_POST(u, headers=COMPRESSED)).getroot()
         old_srcmd5 = root.findall('old')[0].get('srcmd5')
         logging.debug('%s old srcmd5 %s in %s' % (package, old_srcmd5, old_prj))
         new_srcmd5 = root.findall('new')[0].get('srcmd5')
@@ -134,63 +174,82 @@ class CompareList(object):
         print('Gathering the package list from %s' % self.old_prj)
         source = self.get_source_packages(self.old_prj)
         print('Gathering the package list from %s' % self.new_prj)
-        target = self.get_source_packages(self.new_prj)
+        # only used for lookups
+        target = set(self.get_source_packages(self.new_prj))
         removed_packages = self.removed_pkglist(self.old_prj)
         if self.existin:
             print('Gathering the package list from %s' % self.existin)
-            existin_packages = self.get_source_packages(self.existin)
+            existin_packages = set(self.get_source_packages(self.existin))
 
         if not self.removedonly:
             if self.submitto:
                 dest = self.submitto
             else:
                 dest = self.new_prj
-            removed_pkgs_in_target = self.removed_pkglist(dest)
-            submit_counter = 0
-            for pkg in source:
-                if pkg.startswith('00') or pkg.startswith('_'):
-                    continue
-
-                if pkg not in target:
-                    # ignore the second specfile package
-                    linked = self.is_linked_package(self.old_prj, pkg)
-                    if linked:
+            removed_pkgs_in_target = set(self.removed_pkglist(dest))
+            # request the diffs of the common packages up front, they
+            # are reported in package order below
+            executor = ThreadPoolExecutor(max_workers=DIFF_WORKERS)
+            try:
+                diffs = dict()
+                if not self.newonly:
+                    # packages with the same srcmd5 in both projects have no
+                    # diff, only ask for the others
+                    old_srcmd5s, _ = self.get_source_info(self.old_prj)
+                    new_srcmd5s, _ = self.get_source_info(self.new_prj)
+                    for pkg in source:
+                        if pkg in target and not pkg.startswith(('00', '_')):
+                            srcmd5 = old_srcmd5s.get(pkg)
+                            if srcmd5 is None or srcmd5 != new_srcmd5s.get(pkg):
+                                diffs[pkg] = executor.submit(self.check_diff, pkg, self.old_prj, self.new_prj)
+                submit_counter = 0
+                for pkg in source:
+                    if pkg.startswith('00') or pkg.startswith('_'):
                         continue
 
-                    if self.existin:
-                        if pkg not in existin_packages:
+                    if pkg not in target:
+                        # ignore the second specfile package
+                        linked = self.is_linked_package(self.old_prj, pkg)
+                        if linked:
                             continue
 
-                    if pkg in removed_pkgs_in_target:
-                        print("New package but has removed from {:<8} - {}".format(self.new_prj, pkg))
-                        continue
-
-                    print("New package than {:<8} - {}".format(self.new_prj, pkg))
+                        if self.existin:
+                            if pkg not in existin_packages:
+                                continue
 
-                    if self.submit:
-                        if self.submit_limit and submit_counter > int(self.submit_limit):
-                            return
+                        if pkg in removed_pkgs_in_target:
+                            print("New package but has removed from {:<8} - {}".format(self.new_prj, pkg))
+                            continue
 
-                        if self.submitfrom and self.submitto:
-                            if not self.item_exists(self.submitfrom, pkg):
-                                print("%s not found in %s" % (pkg, self.submitfrom))
-                                continue
-                            msg = "Automated submission of a package from %s to %s" % (self.submitfrom, self.submitto)
-                            if self.existin:
-                                msg += " that was included in %s" % (self.existin)
-                            if self.submit_new_package(self.submitfrom, self.submitto, pkg, msg):
-                                submit_counter += 1
-                        else:
-                            msg = "Automated submission of a package from %s that is new in %s" % (
-                                self.old_prj, self.new_prj)
-                            if self.submit_new_package(self.old_prj, self.new_prj, pkg, msg):
-                                submit_counter += 1
-                elif not self.newonly:
-                    diff = self.check_diff(pkg, self.old_prj, self.new_prj)
-                    if diff:
-                        print("Different source in {:<8} - {}".format(self.new_prj, pkg))
-                        if self.verbose:
-                            print("=== Diff ===\n{}".format(diff))
+                        print("New package than {:<8} - {}".format(self.new_prj, pkg))
+
+                        if self.submit:
+                            if self.submit_limit and submit_counter > int(self.submit_limit):
+                                return
+
+                            if self.submitfrom and self.submitto:
+                                if not self.item_exists(self.submitfrom, pkg):
+                                    print("%s not found in %s" % (pkg, self.submitfrom))
+                                    continue
+                                msg = "Automated submission of a package from %s to %s" % (self.submitfrom, self.submitto)
+                                if self.existin:
+                                    msg += " that was included in %s" % (self.existin)
+                                if self.submit_new_package(self.submitfrom, self.submitto, pkg, msg):
+                                    submit_counter += 1
+                            else:
+                                msg = "Automated submission of a package from %s that is new in %s" % (
+                                    self.old_prj, self.new_prj)
+                                if self.submit_new_package(self.old_prj, self.new_prj, pkg, msg):
+                                    submit_counter += 1
+                    elif pkg in diffs:
+                        diff = diffs[pkg].result()
+                        if diff:
+                            print("Different source in {:<8} - {}".format(self.new_prj, pkg))
+                            if self.verbose:
+                                print("=== Diff ===\n{}".format(diff))
+            finally:
+                # do not leave the pending diffs running when bailing out
+                executor.shutdown(cancel_futures=True)
 
         for pkg in removed_packages:
             if pkg in target:
@@ -203,7 +262,8 @@ def main(args):
     osc.conf.config['debug'] = args.debug
 
     uc = CompareList(args.old_prj, args.new_prj, args.verbose, args.newonly,
-                     args.removedonly, args.existin, args.submit, args.submitfrom, args.submitto, args.submit_limit)
+                     args.removedonly, args.existin, args.submit, args.submitfrom, args.submitto, args.submit_limit,
+                     args.cache_requests)
     uc.crawl()
 
 
@@ -235,6 +295,8 @@ if __name__ == '__main__':
                         help='submit new package to, define --submitfrom is required')
     parser.add_argument('--limit', dest='submit_limit', metavar='NUMBERS',
                         help='limit numbers packages to submit')
+    parser.add_argument('--cache-requests', action='store_true', default=False,
+                        help='cache the package lists between runs for %d minutes' % (CACHE_TTL // 60))
 
     args = parser.parse_args()
 
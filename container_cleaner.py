@@ -2,110 +2,134 @@
 # (c) 2019 fvogt@suse.de
 # GPLv3-only
 
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 import osc.conf
 import osc.core
 import logging
 import ToolBase
+from osclib.core import http_pool_grow
 import sys
-import re
 from lxml import etree as xml
 
+# number of listings fetched from OBS at the same time
+FETCH_WORKERS = 16
+
+logger = logging.getLogger(__name__)
+
 
 class ContainerCleaner(ToolBase.ToolBase):
     def __init__(self):
         ToolBase.ToolBase.__init__(self)
-        self.logger = logging.getLogger(__name__)
+        self.logger = logger
 
     def getDirEntries(self, path):
         url = self.makeurl(path)
-        directory = xml.parse(self.retried_GET(url))
-        return directory.xpath("entry/@name")
-
-    def getDirBinaries(self, path):
-        url = self.makeurl(path)
-        directory = xml.parse(self.retried_GET(url))
-        return directory.xpath("binary/@filename")
+        entries = []
+        for _, entry in xml.iterparse(self.retried_GET(url), tag="entry"):
+            entries.append(entry.get("name"))
+            entry.clear()
+        return entries
+
+    def getBinaryList(self, project, arch):
+        """Return {buildcontainer: [filename, ...]} for all containers built for arch"""
+        url = self.makeurl(["build", project, "_result"],
+                           {"view": "binarylist", "repository": "containers", "arch": arch, "multibuild": 1})
+        binaries = {}
+        for _, binarylist in xml.iterparse(self.retried_GET(url), tag="binarylist"):
+            binaries[binarylist.get("package")] = [binary.get("filename") for binary in binarylist.iterchildren("binary")]
+            binarylist.clear()
+        return binaries
+
+    def growConnectionPool(self):
+        """Keep the connections of the parallel requests open for reuse"""
+        http_pool_grow(self.apiurl, FETCH_WORKERS)
 
     def findSourcepkgsToDelete(self, project):
+        # Checked once, the loops below log per container and arch
+        debug = logger.isEnabledFor(logging.DEBUG)
+
         # Get a list of all images
         srccontainers = self.getDirEntries(["source", project])
+        srccontainers_set = set(srccontainers)
 
         # Sort them into buckets for each package:
         # {"opensuse-tumbleweed-image": ["opensuse-tumbleweed-image.20190402134201", ...]}
-        buckets = {}
-        regex_maintenance_release = re.compile(R"^(.+)\.[0-9]+$")
+        buckets = defaultdict(list)
         for srccontainer in srccontainers:
             # Get the right bucket
-            match = regex_maintenance_release.match(srccontainer)
-            if match:
+            name, _, release = srccontainer.rpartition(".")
+            if name and release.isdigit() and release.isascii():
                 # Maintenance release
-                package = match.group(1)
+                package = name
             else:
                 # Not renamed
                 package = srccontainer
 
-            if package not in buckets:
-                buckets[package] = []
-
-            buckets[package] += [srccontainer]
+            buckets[package].append(srccontainer)
 
         for package in buckets:
             # Sort each bucket: Newest provider first
             buckets[package].sort(reverse=True)
-            logging.debug("Found %d providers of %s", len(buckets[package]), package)
+            logger.debug("Found %d providers of %s", len(buckets[package]), package)
 
         # Get a hash for sourcecontainer -> arch with binaries
         # {"opensuse-tumbleweed-image.20190309164844": ["aarch64", "armv7l", "armv6l"],
         # "kubic-pause-image.20190306124139": ["x86_64", "i586"], ... }
-        srccontainerarchs = {}
+        srccontainerarchs = defaultdict(list)
 
         archs = self.getDirEntries(["build", project, "containers"])
-        regex_srccontainer = re.compile(R"^([^:]+)(:[^:]+)?$")
-        for arch in archs:
-            buildcontainers = self.getDirEntries(["build", project, "containers", arch])
-            for buildcontainer in buildcontainers:
-                bins = self.getDirBinaries(["build", project, "containers", arch, buildcontainer])
+        self.growConnectionPool()
+        with ThreadPoolExecutor(max_workers=FETCH_WORKERS) as executor:
+            archbinaries = executor.map(lambda arch: self.getBinaryList(project, arch), archs)
+            allbins = ((arch, buildcontainer, bins)
+                       for arch, binaries in zip(archs, archbinaries)
+                       for buildcontainer, bins in binaries.items())
+
+            for arch, buildcontainer, bins in allbins:
                 if len(bins) > 0:
-                    match = regex_srccontainer.match(buildcontainer)
-                    if not match:
+                    # Strip the multibuild flavor, if any
+                    srccontainer, colon, flavor = buildcontainer.partition(":")
+                    if not srccontainer or ":" in flavor or (colon and not flavor):
                         raise Exception("Could not map %s to source container" % buildcontainer)
 
-                    srccontainer = match.group(1)
-                    if srccontainer not in srccontainers:
+                    if srccontainer not in srccontainers_set:
                         raise Exception("Mapped %s to wrong source container (%s)" % (buildcontainer, srccontainer))
 
-                    if srccontainer not in srccontainerarchs:
-                        srccontainerarchs[srccontainer] = []
-
-                    logging.debug("%s provides binaries for %s", srccontainer, arch)
-                    srccontainerarchs[srccontainer] += [arch]
+                    if debug:
+                        logger.debug("%s provides binaries for %s", srccontainer, arch)
+                    srccontainerarchs[srccontainer].append(arch)
 
         # Now go through each bucket and find out what doesn't contribute to the newest five
         can_delete = []
         for package in buckets:
             # {"x86_64": 1, "aarch64": 2, ...}
-            archs_found = {}
-            for arch in archs:
-                archs_found[arch] = 0
+            archs_found = dict.fromkeys(archs, 0)
+            # Number of archs which already have five providers, once all
+            # of them do the remaining (older) ones can't contribute anymore
+            saturated = 0
 
             for srccontainer in buckets[package]:
                 contributes = False
-                if srccontainer in srccontainerarchs:
+                if saturated < len(archs) and srccontainer in srccontainerarchs:
                     for arch in srccontainerarchs[srccontainer]:
                         if archs_found[arch] < 5:
                             archs_found[arch] += 1
                             contributes = True
+                            if archs_found[arch] == 5:
+                                saturated += 1
 
                 if contributes:
-                    logging.debug("%s contributes to %s", srccontainer, package)
+                    if debug:
+                        logger.debug("%s contributes to %s", srccontainer, package)
                 else:
-                    logging.info("%s does not contribute", srccontainer)
-                    if len([count for count in archs_found.values() if count > 0]) == 0:
+                    logger.info("%s does not contribute", srccontainer)
+                    if not any(archs_found.values()):
                         # If there are A, B, C and D, with only C and D providing binaries,
                         # A and B aren't deleted because they have newer sources. This is
                         # to avoid deleting something due to unforeseen circumstances, e.g.
                         # OBS didn't copy the binaries yet.
-                        logging.info("No newer provider found either, ignoring")
+                        logger.info("No newer provider found either, ignoring")
                     else:
                         can_delete += [srccontainer]
 
@@ -117,7 +141,7 @@ class ContainerCleaner(ToolBase.ToolBase):
         for package in packages:
             url = self.makeurl(["source", project, package])
             if self.dryrun:
-                logging.info("DELETE %s", url)
+                logger.info("DELETE %s", url)
             else:
                 osc.core.http_DELETE(url)
 
@@ -1,6 +1,7 @@
 #!/usr/bin/python3
 
 import argparse
+from concurrent.futures import ThreadPoolExecutor
 import logging
 import osc
 import yaml
@@ -13,10 +14,14 @@ from datetime import datetime, timezone
 
 from flask import Flask, render_template
 
+# number of projects fetched at the same time
+FETCH_WORKERS = 16
+
 
 class Fetcher(object):
     def __init__(self, apiurl, opts):
         self.projects = []
+        self.added = []
         self.opts = opts
         self.apiurl = apiurl
         if apiurl.endswith('suse.de'):
@@ -42,24 +47,35 @@ class Fetcher(object):
         return jobs
 
     def add(self, name, **kwargs):
-        # cyclic dependency!
-        self.projects.append(Project(self, name, kwargs))
+        self.added.append((name, kwargs))
+
+    def fetch(self):
+        # every project needs several requests, do them all at once
+        with ThreadPoolExecutor(max_workers=FETCH_WORKERS) as executor:
+            # cyclic dependency!
+            self.projects = list(executor.map(lambda added: Project(self, *added), self.added))
 
-    def build_summary(self, project, repository):
-        url = makeurl(self.apiurl, ['build', project, '_result'], {'repository': repository, 'view': 'summary'})
+    def build_summaries(self, project):
+        """Return the build summary of all repositories of project, by repository"""
+        url = makeurl(self.apiurl, ['build', project, '_result'], {'view': 'summary'})
         try:
             f = http_GET(url)
         except HTTPError:
-            return {'building': -1}
-        root = ET.parse(f).getroot()
+            return {}
+        statuscounts = {}
+        for _, result in ET.iterparse(f, tag='result'):
+            statuscounts.setdefault(result.get('repository'), []).extend(
+                (statuscount.get('code'), int(statuscount.get('count'))) for statuscount in result.iter('statuscount'))
+            result.clear()
+        return {repository: self.build_summary(counts) for repository, counts in statuscounts.items()}
+
+    def build_summary(self, statuscounts):
         failed = 0
         unresolvable = 0
         building = 0
         succeeded = 0
         broken = 0
-        for result in root.findall('.//statuscount'):
-            code = result.get('code')
-            count = int(result.get('count'))
+        for code, count in statuscounts:
             if code == 'excluded' or code == 'disabled' or code == 'locked':
                 continue  # ignore
             if code == 'succeeded':
@@ -118,15 +134,17 @@ class Project(object):
         self.all_archs = fetcher.generate_all_archs(name)
         self.ttm_status = fetcher.fetch_ttm_status(name)
         self.ttm_version = fetcher.fetch_product_version(name)
+        self.build_summaries = fetcher.build_summaries(name)
+        self.openqa_jobs = fetcher.openqa_results(self.openqa_id, self.ttm_status.get('testing'))
 
     def build_summary(self, repo):
-        return fetcher.build_summary(self.name, repo)
+        return self.build_summaries.get(repo, {'building': -1})
 
     def all_archs(self):
         self.all_archs
 
     def openqa_summary(self):
-        return self.fetcher.openqa_results(self.openqa_id, self.ttm_status.get('testing'))
+        return self.openqa_jobs
 
 
 if __name__ == '__main__':
@@ -197,6 +215,8 @@ if __name__ == '__main__':
         fetcher.add('openSUSE:Leap:15.4:ARM:Images', nick='Leap:15.4:ARM:Images',
                     openqa_group='openSUSE Leap 15.4 ARMv7 Images', openqa_version='15.4', openqa_groupid=91)
 
+    fetcher.fetch()
+
     with app.app_context():
         rendered = render_template('dashboard.html',
                                    projectname=args.project,
@@ -1,6 +1,7 @@
 #!/usr/bin/python3
 
 import argparse
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 import sys
 from lxml import etree as ET
@@ -15,14 +16,22 @@ from osclib.conf import Config
 from osclib.core import devel_project_fallback
 from osclib.core import entity_email
 from osclib.core import get_request_list_with_history
+from osclib.core import http_pool_grow
 from osclib.core import package_list_kind_filtered
 from osclib.core import request_age
+from osclib.memoize import memoize
 from osclib.stagingapi import StagingAPI
 from osclib.util import mail_send
 
 
 BOT_NAME = 'devel-project'
 REMINDER = 'review reminder'
+# number of devel projects queried at the same time
+FETCH_WORKERS = 16
+
+devel_project_xpath = ET.XPath('package/devel/@project', smart_strings=False)
+maintainer_groups_xpath = ET.XPath('group[@role="maintainer"]/@groupid', smart_strings=False)
+maintainer_users_xpath = ET.XPath('person[@role="maintainer"]/@userid', smart_strings=False)
 
 
 def search(apiurl, queries=None, **kwargs):
@@ -47,6 +56,11 @@ def staging_api(args):
     return StagingAPI(apiurl, args.project)
 
 
+@memoize(session=True)
+def project_meta_get(apiurl, project):
+    return ET.fromstringlist(show_project_meta(apiurl, project))
+
+
 def devel_projects_get(apiurl, project):
     """
     Returns a sorted list of devel projects for a given project.
@@ -54,15 +68,12 @@ def devel_projects_get(apiurl, project):
     Loads all packages for a given project, checks them for a devel link and
     keeps a list of unique devel projects.
     """
-    devel_projects = {}
-
-    root = search(apiurl, **{'package': "@project='{}'".format(project)})['package']
-    for devel in root.findall('package/devel[@project]'):
-        devel_projects[devel.attrib['project']] = True
+    # Only packages with a devel link are of interest, let OBS filter the rest.
+    root = search(apiurl, **{'package': "@project='{}' and devel/@project!=''".format(project)})['package']
+    devel_projects = set(devel_project_xpath(root))
 
     # Ensure self does not end up in list.
-    if project in devel_projects:
-        del devel_projects[project]
+    devel_projects.discard(project)
 
     return sorted(devel_projects)
 
@@ -98,12 +109,14 @@ def maintainer(args):
 
     apiurl = osc.conf.config['apiurl']
     devel_projects = devel_projects_load(args)
-    for devel_project in devel_projects:
-        meta = ET.fromstringlist(show_project_meta(apiurl, devel_project))
-        groups = meta.xpath('group[@role="maintainer"]/@groupid')
-        intersection = set(groups).intersection(desired)
-        if len(intersection) != len(desired):
-            print('{} missing {}'.format(devel_project, ', '.join(desired - intersection)))
+    http_pool_grow(apiurl, FETCH_WORKERS)
+    with ThreadPoolExecutor(max_workers=FETCH_WORKERS) as executor:
+        metas = executor.map(lambda devel_project: project_meta_get(apiurl, devel_project), devel_projects)
+        for devel_project, meta in zip(devel_projects, metas):
+            groups = maintainer_groups_xpath(meta)
+            intersection = set(groups).intersection(desired)
+            if len(intersection) != len(desired):
+                print('{} missing {}'.format(devel_project, ', '.join(desired - intersection)))
 
 
 def notify(args):
@@ -162,77 +175,83 @@ def requests(args):
 
     # Disable including source project in get_request_list() query.
     osc.conf.config['include_request_from_project'] = False
-    for devel_project in devel_projects:
-        requests = get_request_list_with_history(
+    reminded = set()
+    http_pool_grow(apiurl, FETCH_WORKERS)
+    with ThreadPoolExecutor(max_workers=FETCH_WORKERS) as executor:
+        all_requests = executor.map(lambda devel_project: get_request_list_with_history(
             apiurl, devel_project, req_state=('new', 'review'),
-            req_type='submit')
-        for request in requests:
-            action = request.actions[0]
-            age = request_age(request).days
-            if age < args.min_age:
-                continue
-
-            print(' '.join((
-                request.reqid,
-                '/'.join((action.tgt_project, action.tgt_package)),
-                '/'.join((action.src_project, action.src_package)),
-                '({} days old)'.format(age),
-            )))
-
-            if args.remind:
-                remind_comment(apiurl, args.repeat_age, request.reqid, action.tgt_project, action.tgt_package)
+            req_type='submit'), devel_projects)
+        for requests in all_requests:
+            for request in requests:
+                action = request.actions[0]
+                age = request_age(request).days
+                if age < args.min_age:
+                    continue
+
+                print(' '.join((
+                    request.reqid,
+                    '/'.join((action.tgt_project, action.tgt_package)),
+                    '/'.join((action.src_project, action.src_package)),
+                    '({} days old)'.format(age),
+                )))
+
+                if args.remind and request.reqid not in reminded:
+                    reminded.add(request.reqid)
+                    remind_comment(apiurl, args.repeat_age, request.reqid, action.tgt_project, action.tgt_package)
 
 
 def reviews(args):
     apiurl = osc.conf.config['apiurl']
     devel_projects = devel_projects_load(args)
 
-    for devel_project in devel_projects:
-        requests = get_review_list(apiurl, byproject=devel_project)
-        for request in requests:
-            # get_review_list() behavior has been changed in osc
-            # https://github.com/openSUSE/osc/commit/00decd25d1a2c775e455f8865359e0d21872a0a5
-            if request.state.name != 'review':
-                continue
-            action = request.actions[0]
-            if action.type != 'submit':
-                continue
-
-            age = request_age(request).days
-            if age < args.min_age:
-                continue
-
-            for review in request.reviews:
-                if review.by_project == devel_project:
-                    break
-
-            print(' '.join((
-                request.reqid,
-                '/'.join((review.by_project, review.by_package)) if review.by_package else review.by_project,
-                '/'.join((action.tgt_project, action.tgt_package)),
-                '({} days old)'.format(age),
-            )))
-
-            if args.remind:
-                remind_comment(apiurl, args.repeat_age, request.reqid, review.by_project, review.by_package)
-
-
+    # A request may be in review by several devel projects, remind only once.
+    reminded = set()
+    http_pool_grow(apiurl, FETCH_WORKERS)
+    with ThreadPoolExecutor(max_workers=FETCH_WORKERS) as executor:
+        all_requests = executor.map(lambda devel_project: get_review_list(apiurl, byproject=devel_project), devel_projects)
+        for devel_project, requests in zip(devel_projects, all_requests):
+            for request in requests:
+                # get_review_list() behavior has been changed in osc
+                # https://github.com/openSUSE/osc/commit/00decd25d1a2c775e455f8865359e0d21872a0a5
+                if request.state.name != 'review':
+                    continue
+                action = request.actions[0]
+                if action.type != 'submit':
+                    continue
+
+                age = request_age(request).days
+                if age < args.min_age:
+                    continue
+
+                for review in request.reviews:
+                    if review.by_project == devel_project:
+                        break
+
+                print(' '.join((
+                    request.reqid,
+                    '/'.join((review.by_project, review.by_package)) if review.by_package else review.by_project,
+                    '/'.join((action.tgt_project, action.tgt_package)),
+                    '({} days old)'.format(age),
+                )))
+
+                if args.remind and request.reqid not in reminded:
+                    reminded.add(request.reqid)
+                    remind_comment(apiurl, args.repeat_age, request.reqid, review.by_project, review.by_package)
+
+
+@memoize(session=True)
 def maintainers_get(apiurl, project, package=None):
     if package:
         try:
-            meta = show_package_meta(apiurl, project, package)
+            meta = ET.fromstringlist(show_package_meta(apiurl, project, package))
         except HTTPError as e:
             if e.code == 404:
                 # Fallback to project in the case of new package.
-                meta = show_project_meta(apiurl, project)
+                meta = project_meta_get(apiurl, project)
     else:
-        meta = show_project_meta(apiurl, project)
-    meta = ET.fromstringlist(meta)
-
-    userids = []
-    for person in meta.findall('person[@role="maintainer"]'):
-        userids.append(person.get('userid'))
+        meta = project_meta_get(apiurl, project)
 
+    userids = maintainer_users_xpath(meta)
     if len(userids) == 0 and package is not None:
         # Fallback to project if package has no maintainers.
         return maintainers_get(apiurl, project)
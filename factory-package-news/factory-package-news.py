@@ -2,6 +2,8 @@
 
 from pprint import pprint
 import io
+import json
+import multiprocessing
 import os
 import sys
 import logging
@@ -9,14 +11,117 @@ import rpm
 import pickle
 import cmdln
 import re
+import struct
 
 SRPM_RE = re.compile(
     r'(?P<name>.+)-(?P<version>[^-]+)-(?P<release>[^-]+)\.(?P<suffix>(?:no)?src\.rpm)$')
 
+# binary kernel flavors whose changelogs are the one of kernel-source
+KERNEL_SRPMS = frozenset((
+    'kernel-64kb',
+    'kernel-debug',
+    'kernel-default',
+    'kernel-desktop',
+    'kernel-docs',
+    'kernel-ec2',
+    'kernel-lpae',
+    'kernel-obs-build',
+    'kernel-obs-qa-xen',
+    'kernel-obs-qa',
+    'kernel-pae',
+    'kernel-pv',
+    'kernel-syms',
+    'kernel-vanilla',
+    'kernel-xen',
+))
+
 data_version = 3
 
 changelog_max_lines = 100  # maximum number of changelog lines per package
 
+RPM_LEAD_SIZE = 96
+RPM_LEAD_MAGIC = b'\xed\xab\xee\xdb'
+RPM_HEADER_MAGIC = b'\x8e\xad\xe8'
+RPM_HEADER_READ_SIZE = 128 * 1024  # enough for the headers of most packages
+
+
+def rpm_header_size(buf):
+    """ Size of lead, signature and header of the rpm at the start of buf.
+
+    Only a lower bound while it is larger than buf, read more and ask again then.
+    """
+    if buf[:4] != RPM_LEAD_MAGIC:
+        return len(buf)
+    size = RPM_LEAD_SIZE
+    # the signature header is padded to 8 bytes, the main header is not
+    for padded in (True, False):
+        if len(buf) < size + 16:
+            return size + 16
+        if buf[size:size + 3] != RPM_HEADER_MAGIC:
+            return len(buf)
+        il, dl = struct.unpack('>II', buf[size + 8:size + 16])
+        size += 16 + 16 * il + dl
+        if padded:
+            size += -size % 8
+    return size
+
+
+def header_data(h):
+    """ The parts of rpm header h needed here, as plain (picklable) data. """
+    evr = dict()
+    for tag in ['name', 'version', 'release', 'sourcerpm']:
+        evr[tag] = str(h[tag], 'utf-8')
+    return evr, h['changelogtime'], [str(txt, 'utf-8') for txt in h['changelogtext']]
+
+
+worker_ts = None
+
+
+def worker_init():
+    global worker_ts
+    worker_ts = rpm.TransactionSet()
+    worker_ts.setVSFlags(rpm._RPMVSF_NOSIGNATURES)
+
+
+def worker_read_rpm(filename):
+    """ Read header_data() of an rpm file in a worker process. """
+    fd = os.open(filename, os.O_RDONLY)
+    try:
+        return header_data(worker_ts.hdrFromFdno(fd))
+    except rpm.error as e:
+        print("%s: %s" % (filename, e))
+        return None
+    finally:
+        os.close(fd)
+
+
+def read_rpm_header(fd, offset):
+    """ Read at least everything up to the payload of the rpm at offset in fd. """
+    buf = os.pread(fd, RPM_HEADER_READ_SIZE, offset)
+    while len(buf) < rpm_header_size(buf):
+        more = os.pread(fd, rpm_header_size(buf) - len(buf), offset + len(buf))
+        if not more:
+            break
+        buf += more
+    return buf
+
+
+def snapshot_save(filename, data):
+    """ Save snapshot data as compact json. """
+    with open(filename, 'w') as f:
+        json.dump([data_version, data], f, separators=(',', ':'))
+
+
+def snapshot_load(filename):
+    """ Load snapshot data, returns (version, (pkgs, changelogs)). """
+    # one read of the whole file, both decoders work on the buffer at once
+    with open(filename, 'rb') as f:
+        data = f.read()
+    if data[:1] == b'[':
+        return json.loads(data)
+    # snapshot saved before the switch to json
+    return pickle.loads(data, encoding='utf-8', errors='backslashreplace')
+
 
 class ChangeLogger(cmdln.Cmdln):
     def __init__(self, *args, **kwargs):
@@ -24,72 +129,30 @@ class ChangeLogger(cmdln.Cmdln):
         self.ts = rpm.TransactionSet()
         self.ts.setVSFlags(rpm._RPMVSF_NOSIGNATURES)
 
-    def readRpmHeader(self, filename):
-        """ Read an rpm header. """
-        fd = os.open(filename, os.O_RDONLY)
-        h = self.readRpmHeaderFD(fd)
-        os.close(fd)
-        return h
-
-    def readRpmHeaderFD(self, fd):
-        h = None
-        try:
-            h = self.ts.hdrFromFdno(fd)
-        except rpm.error as e:
-            if str(e) == "public key not available":
-                print(str(e))
-            if str(e) == "public key not trusted":
-                print(str(e))
-            if str(e) == "error reading package header":
-                print(str(e))
-            h = None
-        return h
-
     def readChangeLogs(self, args):
 
         pkgdata = dict()
         changelogs = dict()
 
-        def _getdata(h):
-            srpm = str(h['sourcerpm'], 'utf-8')
-            binrpm = str(h['name'], 'utf-8')
-
-            evr = dict()
-            for tag in ['name', 'version', 'release', 'sourcerpm']:
-                evr[tag] = str(h[tag], 'utf-8')
+        def _getdata(rpmdata):
+            evr, changelogtime, changelogtext = rpmdata
+            srpm = evr['sourcerpm']
+            binrpm = evr['name']
             pkgdata[binrpm] = evr
 
             # dirty hack to reduce kernel spam
-            m = SRPM_RE.match(srpm)
-            if m and m.group('name') in (
-                'kernel-64kb',
-                'kernel-debug',
-                'kernel-default',
-                'kernel-desktop',
-                'kernel-docs',
-                'kernel-ec2',
-                'kernel-lpae',
-                'kernel-obs-build',
-                'kernel-obs-qa-xen',
-                'kernel-obs-qa',
-                'kernel-pae',
-                'kernel-pv',
-                'kernel-syms',
-                'kernel-vanilla',
-                'kernel-xen',
-            ):
+            m = SRPM_RE.match(srpm) if srpm.startswith('kernel-') else None
+            if m and m.group('name') in KERNEL_SRPMS:
                 srpm = '%s-%s-%s.src.rpm' % ('kernel-source', m.group('version'), m.group('release'))
                 pkgdata[binrpm]['sourcerpm'] = srpm
-                print("%s -> %s" % (str(h['sourcerpm'], 'utf-8'), srpm))
+                print("%s -> %s" % (m.group(0), srpm))
 
             if srpm in changelogs:
                 changelogs[srpm]['packages'].append(binrpm)
             else:
                 data = {'packages': [binrpm]}
-                data['changelogtime'] = h['changelogtime']
-                data['changelogtext'] = h['changelogtext']
-                for (t, txt) in enumerate(data['changelogtext']):
-                    data['changelogtext'][t] = str(txt, 'utf-8')
+                data['changelogtime'] = changelogtime
+                data['changelogtext'] = changelogtext
                 changelogs[srpm] = data
 
         for arg in args:
@@ -102,6 +165,10 @@ class ChangeLogger(cmdln.Cmdln):
                 if not iso.is_open() or fd is None:
                     raise Exception("Could not open %s as an ISO-9660 image." % arg)
 
+                # rpm can only read headers from a file descriptor, hand it
+                # each header read in one go from the image through memory
+                memfd = os.memfd_create('rpmheader')
+
                 # On Tumbleweed, there is no '/suse' prefix
                 for path in ['/suse/x86_64', '/suse/noarch', '/suse/aarch64',
                              '/suse/s390x', '/x86_64', '/noarch', '/aarch64', '/s390x']:
@@ -114,19 +181,25 @@ class ChangeLogger(cmdln.Cmdln):
                         LSN = stat[1]
 
                         if (filename.endswith('.rpm')):
-                            os.lseek(fd, LSN * pycdio.ISO_BLOCKSIZE, io.SEEK_SET)
-                            h = self.ts.hdrFromFdno(fd)
-                            _getdata(h)
-
+                            buf = read_rpm_header(fd, LSN * pycdio.ISO_BLOCKSIZE)
+                            os.ftruncate(memfd, 0)
+                            os.pwrite(memfd, buf, 0)
+                            os.lseek(memfd, 0, io.SEEK_SET)
+                            h = self.ts.hdrFromFdno(memfd)
+                            _getdata(header_data(h))
+
+                os.close(memfd)
                 os.close(fd)
 
             elif os.path.isdir(arg):
+                pkgs = []
                 for root, dirs, files in os.walk(arg):
-                    for pkg in [os.path.join(root, file) for file in files]:
-                        if not pkg.endswith('.rpm'):
-                            continue
-                        h = self.readRpmHeader(pkg)
-                        _getdata(h)
+                    pkgs += [os.path.join(root, file) for file in files if file.endswith('.rpm')]
+                # parsing the headers is cpu bound, spread it over all cores
+                with multiprocessing.Pool(initializer=worker_init) as pool:
+                    for rpmdata in pool.imap(worker_read_rpm, pkgs, chunksize=64):
+                        if rpmdata is not None:
+                            _getdata(rpmdata)
             else:
                 raise Exception("don't know what to do with %s" % arg)
 
@@ -148,8 +221,7 @@ class ChangeLogger(cmdln.Cmdln):
         if not opts.snapshot:
             raise Exception("missing snapshot option")
 
-        f = open(os.path.join(opts.dir, opts.snapshot), 'wb')
-        pickle.dump([data_version, self.readChangeLogs(dirs)], f)
+        snapshot_save(os.path.join(opts.dir, opts.snapshot), self.readChangeLogs(dirs))
 
     def do_dump(self, subcmd, opts, *dirs):
         """${cmd_name}: pprint the package changelog information
@@ -165,9 +237,7 @@ class ChangeLogger(cmdln.Cmdln):
         ${cmd_usage}
         ${cmd_option_list}
         """
-        f = open(filename, 'rb')
-        (v, (pkgs, changelogs)) = pickle.load(
-            f, encoding='utf-8', errors='backslashreplace')
+        (v, (pkgs, changelogs)) = snapshot_load(filename)
         pprint(pkgs[package])
         pprint(changelogs[pkgs[package]['sourcerpm']])
 
@@ -192,14 +262,10 @@ class ChangeLogger(cmdln.Cmdln):
         if not os.path.isdir(opts.dir):
             raise Exception("%s must be a directory" % opts.dir)
 
-        f = open(os.path.join(opts.dir, version1), 'rb')
-        (v, (v1pkgs, v1changelogs)) = pickle.load(f,
-                                                  encoding='utf-8', errors='backslashreplace')
+        (v, (v1pkgs, v1changelogs)) = snapshot_load(os.path.join(opts.dir, version1))
         if v != data_version:
             raise Exception("not matching version %s in %s" % (v, version1))
-        f = open(os.path.join(opts.dir, version2), 'rb')
-        (v, (v2pkgs, v2changelogs)) = pickle.load(f,
-                                                  encoding='utf-8', errors='backslashreplace')
+        (v, (v2pkgs, v2changelogs)) = snapshot_load(os.path.join(opts.dir, version2))
         if v != data_version:
             raise Exception("not matching version %s in %s" % (v, version2))
 
@@ -207,7 +273,9 @@ class ChangeLogger(cmdln.Cmdln):
         p2 = set(v2pkgs.keys())
 
         print('Packages changed:')
-        group = self._get_packages_grouped(v2pkgs, p1 & p2)
+        # only binaries built from a different source rpm can have news
+        changed = {p for p in p1 & p2 if v1pkgs[p]['sourcerpm'] != v2pkgs[p]['sourcerpm']}
+        group = self._get_packages_grouped(v2pkgs, changed)
 #        pprint(p1&p2)
 #        pprint(group)
 #        print "  "+"\n  ".join(["\n   * ".join(sorted(group[s])) for s in sorted(group.keys()) ])
@@ -215,8 +283,6 @@ class ChangeLogger(cmdln.Cmdln):
         for srpm in sorted(group.keys()):
             srpm1 = v1pkgs[group[srpm][0]]['sourcerpm']
             # print group[srpm], srpm, srpm1
-            if srpm1 == srpm:
-                continue  # source package unchanged
             try:
                 t1 = v1changelogs[srpm1]['changelogtime'][0]
             except IndexError:
@@ -244,11 +310,13 @@ class ChangeLogger(cmdln.Cmdln):
             if len(pkgs) > 1:
                 details += "Subpackages: %s\n" % " ".join([p for p in pkgs if p != name])
 
-            changedetails = ""
-            for (i2, t2) in enumerate(v2changelogs[srpm]['changelogtime']):
+            # changelogs are newest first
+            new = 0
+            for t2 in v2changelogs[srpm]['changelogtime']:
                 if t2 <= t1:
                     break
-                changedetails += "\n" + v2changelogs[srpm]['changelogtext'][i2]
+                new += 1
+            changedetails = "".join("\n" + text for text in v2changelogs[srpm]['changelogtext'][:new])
 
             # if a changelog is too long, cut it off after changelog_max_lines lines
             changedetails_lines = changedetails.splitlines()
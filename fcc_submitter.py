@@ -1,6 +1,7 @@
 #!/usr/bin/python3
 
 import argparse
+from concurrent.futures import ThreadPoolExecutor
 import logging
 import sys
 import time
@@ -14,12 +15,24 @@ from lxml import etree as ET
 import osc.conf
 import osc.core
 from osclib.core import devel_project_get
+from osclib.core import http_pool_grow
 from osclib.core import project_pseudometa_package
 
 OPENSUSE = 'openSUSE:Leap:15.2'
 OPENSUSE_PREVERSION = 'openSUSE:Leap:15.1'
 OPENSUSE_RELEASED_VERSION = ['openSUSE:Leap:15.0', 'openSUSE:Leap:15.1']
 FCC = '{}:FactoryCandidates'.format(OPENSUSE)
+# number of link sources looked up at the same time
+FETCH_WORKERS = 16
+# minimal number of seconds between two submit requests
+SUBMIT_INTERVAL = 5
+# seconds to wait when the server asks to slow down without saying how long
+RETRY_AFTER_DEFAULT = 60
+# number of times a submit request is tried while the server is busy
+SUBMIT_ATTEMPTS = 3
+
+# parser for the documents read as a whole; those are small but there is no need for ids or entities
+PARSER = ET.XMLParser(collect_ids=False, resolve_entities=False, remove_blank_text=True)
 
 makeurl = osc.core.makeurl
 http_GET = osc.core.http_GET
@@ -27,6 +40,29 @@ http_POST = osc.core.http_POST
 http_PUT = osc.core.http_PUT
 
 
+def patterns_compile(patterns):
+    """Compile the non-empty regular expressions of patterns.
+
+    Each one is compiled on its own so flags, groups and anchors keep their meaning.
+    """
+    return [re.compile(pattern) for pattern in patterns if pattern]
+
+
+def patterns_search(patterns, string):
+    """Whether any of the compiled patterns matches somewhere in string."""
+    return any(pattern.search(string) for pattern in patterns)
+
+
+def iterparse_elements(source, tag):
+    """Yield each `tag` element of the XML read from `source`, freeing it once handled."""
+    for _, elem in ET.iterparse(source, tag=tag, resolve_entities=False, huge_tree=True):
+        yield elem
+        elem.clear()
+        # drop the handled siblings too, clear() leaves them empty in the tree
+        while elem.getprevious() is not None:
+            del elem.getparent()[0]
+
+
 class FccFreezer(object):
     def __init__(self):
         self.factory = 'openSUSE:Factory'
@@ -35,20 +71,29 @@ class FccFreezer(object):
 
     def list_packages(self, project):
         url = makeurl(self.apiurl, ['source', project])
-        pkglist = []
+        pkglist = set()
 
-        root = ET.parse(http_GET(url)).getroot()
-        xmllines = root.findall("./entry")
-        for pkg in xmllines:
-            pkglist.append(pkg.attrib['name'])
+        for entry in iterparse_elements(http_GET(url), 'entry'):
+            pkglist.add(entry.get('name'))
 
-        return set(pkglist)
+        return pkglist
 
-    def check_one_source(self, flink, si, pkglist, pkglist_prever):
+    def get_lsrcmd5(self, package):
+        url = makeurl(self.apiurl, ['source', self.factory, package], {'view': 'info', 'nofilename': '1'})
+        # read before parsing: the parser is shared by the lookup threads and held while parsing
+        proot = ET.fromstring(http_GET(url).read(), PARSER)
+        lsrcmd5 = proot.get('lsrcmd5')
+        if lsrcmd5 is None:
+            raise Exception("{}/{} is not a link but we expected one".format(self.factory, package))
+        return lsrcmd5
+
+    def check_one_source(self, flink, si, pkglist, pkglist_prever, links):
         """
         Insert package information to the temporary frozenlinks.
         Return package name if the package can not fit the condition
         add to the frozenlinks, can be the ignored package.
+        Packages linked within Factory are added to links, their srcmd5
+        has to be filled in afterwards.
         """
         package = si.get('package')
         logging.debug("Processing %s" % (package))
@@ -66,14 +111,8 @@ class FccFreezer(object):
             if linked.get('project') == self.factory:
                 if linked.get('package') in pkglist or linked.get('package') in pkglist_prever:
                     return package
-                url = makeurl(self.apiurl, ['source', self.factory, package], {'view': 'info', 'nofilename': '1'})
                 # print(package, linked.get('package'), linked.get('project'))
-                f = http_GET(url)
-                proot = ET.parse(f).getroot()
-                lsrcmd5 = proot.get('lsrcmd5')
-                if lsrcmd5 is None:
-                    raise Exception("{}/{} is not a link but we expected one".format(self.factory, package))
-                ET.SubElement(flink, 'package', {'name': package, 'srcmd5': lsrcmd5, 'vrev': si.get('vrev')})
+                links.append(ET.SubElement(flink, 'package', {'name': package, 'srcmd5': '', 'vrev': si.get('vrev')}))
                 return None
 
         if package in pkglist or package in pkglist_prever:
@@ -94,12 +133,20 @@ class FccFreezer(object):
 
         url = makeurl(self.apiurl, ['source', self.factory], {'view': 'info', 'nofilename': '1'})
         f = http_GET(url)
-        root = ET.parse(f).getroot()
 
-        for si in root.findall('sourceinfo'):
-            package = self.check_one_source(flink, si, pkglist, pkglist_prever)
+        # the info of all of Factory is big, look at one source at a time
+        links = []
+        for si in iterparse_elements(f, 'sourceinfo'):
+            package = self.check_one_source(flink, si, pkglist, pkglist_prever, links)
             if package is not None:
                 ignored_sources.append(str(package))
+
+        # look up the sources of the links all at once
+        http_pool_grow(self.apiurl, FETCH_WORKERS)
+        with ThreadPoolExecutor(max_workers=FETCH_WORKERS) as executor:
+            lsrcmd5s = executor.map(self.get_lsrcmd5, [link.get('name') for link in links])
+            for link, lsrcmd5 in zip(links, lsrcmd5s):
+                link.set('srcmd5', lsrcmd5)
         return ignored_sources
 
     def freeze(self):
@@ -150,13 +197,13 @@ class FccSubmitter(object):
             'mobile:synchronization:FACTORY']
         # put the except packages from skip_devel_project_list, use regex in this list, eg. "^golang-x-(\w+)", "^nodejs$"
         self.except_pkgs_list = []
+        self.last_submit = None
 
     def get_source_packages(self, project, expand=False):
         """Return the list of packages in a project."""
         query = {'expand': 1} if expand else {}
-        root = ET.parse(http_GET(makeurl(self.apiurl, ['source', project],
-                                 query=query))).getroot()
-        packages = [i.get('name') for i in root.findall('entry')]
+        f = http_GET(makeurl(self.apiurl, ['source', project], query=query))
+        packages = [i.get('name') for i in iterparse_elements(f, 'entry')]
 
         return packages
 
@@ -168,49 +215,38 @@ class FccSubmitter(object):
             link = http_GET(makeurl(self.apiurl, ['source', project, package, '_link'])).read()
         except (HTTPError, URLError):
             return None
-        return ET.fromstring(link)
+        return ET.fromstring(link, PARSER)
 
     def get_build_succeeded_packages(self, project):
         """Get the build succeeded packages from `from_prj` project.
         """
 
-        f = osc.core.show_prj_results_meta(self.apiurl, project)
-        root = ET.fromstringlist(f)
-        # print ET.dump(root)
+        url = makeurl(self.apiurl, ['build', project, '_result'])
 
-        failed_multibuild_pacs = []
-        pacs = []
-        for node in root.findall('result'):
+        failed_multibuild_pacs = set()
+        # a dict rather than a set to keep the order of the results
+        pacs = {}
+        for node in iterparse_elements(http_GET(url), 'result'):
             if node.get('repository') == 'standard' and node.get('arch') == 'x86_64':
                 for pacnode in node.findall('status'):
                     if ':' in pacnode.get('package'):
                         mainpac = pacnode.get('package').split(':')[0]
                         if pacnode.get('code') not in ['succeeded', 'excluded']:
-                            failed_multibuild_pacs.append(pacnode.get('package'))
-                            if mainpac not in failed_multibuild_pacs:
-                                failed_multibuild_pacs.append(mainpac)
-                            if mainpac in pacs:
-                                pacs.remove(mainpac)
+                            failed_multibuild_pacs.add(pacnode.get('package'))
+                            failed_multibuild_pacs.add(mainpac)
+                            pacs.pop(mainpac, None)
                         else:
                             if mainpac in failed_multibuild_pacs:
-                                failed_multibuild_pacs.append(pacnode.get('package'))
-                            elif mainpac not in pacs:
-                                pacs.append(mainpac)
+                                failed_multibuild_pacs.add(pacnode.get('package'))
+                            else:
+                                pacs[mainpac] = None
                         continue
                     if pacnode.get('code') == 'succeeded':
-                        pacs.append(pacnode.get('package'))
+                        pacs[pacnode.get('package')] = None
             else:
                 logging.error("Can not find standard/x86_64 results")
 
-        return pacs
-
-    def is_new_package(self, tgt_project, tgt_package):
-        try:
-            logging.debug("Gathering package_meta %s/%s" % (tgt_project, tgt_package))
-            osc.core.show_package_meta(self.apiurl, tgt_project, tgt_package)
-        except (HTTPError, URLError):
-            return True
-        return False
+        return list(pacs)
 
     def create_submitrequest(self, package):
         """Create a submit request using the osc.commandline.Osc class."""
@@ -218,12 +254,29 @@ class FccSubmitter(object):
         dst_project = self.to_prj
 
         msg = 'Automatic request from %s by F-C-C Submitter. Please review this change and decline it if Leap do not need it.' % src_project
-        res = osc.core.create_submit_request(self.apiurl,
-                                             src_project,
-                                             package,
-                                             dst_project,
-                                             package,
-                                             message=msg)
+        # only pace the requests actually created rather than every candidate
+        if self.last_submit is not None:
+            delay = self.last_submit + SUBMIT_INTERVAL - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+        for attempt in range(1, SUBMIT_ATTEMPTS + 1):
+            try:
+                res = osc.core.create_submit_request(self.apiurl,
+                                                     src_project,
+                                                     package,
+                                                     dst_project,
+                                                     package,
+                                                     message=msg)
+                break
+            except HTTPError as e:
+                if e.code not in (429, 503) or attempt == SUBMIT_ATTEMPTS:
+                    raise e
+                # errors made up by osc come without headers
+                retry_after = str((e.headers or {}).get('Retry-After', '')).strip()
+                delay = int(retry_after) if retry_after.isdigit() else RETRY_AFTER_DEFAULT
+                logging.info('Server is busy (%d), retrying %s in %ds' % (e.code, package, delay))
+                time.sleep(delay)
+        self.last_submit = time.monotonic()
         return res
 
     def check_multiple_specfiles(self, project, package):
@@ -233,7 +286,7 @@ class FccSubmitter(object):
             if e.code == 404:
                 return None
             raise e
-        root = ET.fromstring(http_GET(url).read())
+        root = ET.fromstring(http_GET(url).read(), PARSER)
         data = {}
         linkinfo = root.find('linkinfo')
         if linkinfo is not None:
@@ -278,10 +331,9 @@ class FccSubmitter(object):
         query = query.format(project)
         url = makeurl(self.apiurl, ['request'], query)
         f = http_GET(url)
-        root = ET.parse(f).getroot()
 
         pkgs = []
-        for sr in root.findall('request'):
+        for sr in iterparse_elements(f, 'request'):
             tgt_package = sr.find('action').find('target').get('package')
             pkgs.append(tgt_package)
 
@@ -290,7 +342,7 @@ class FccSubmitter(object):
     def load_skip_pkgs_list(self, project, package):
         url = makeurl(self.apiurl, ['source', project, package, '{}?expand=1'.format('fcc_skip_pkgs')])
         try:
-            return http_GET(url).read()
+            return http_GET(url).read().decode('utf-8')
         except HTTPError:
             return ''
 
@@ -305,7 +357,9 @@ class FccSubmitter(object):
         # randomize the list
         random.shuffle(succeeded_packages)
         # get souce packages from target
-        target_packages = self.get_source_packages(self.to_prj)
+        target_packages = set(self.get_source_packages(self.to_prj))
+        # packages visible in the target, including those inherited through project links
+        existing_packages = set(self.get_source_packages(self.to_prj, expand=True))
         deleted_packages = self.get_deleted_packages(self.to_prj)
         if self.to_prj.startswith("openSUSE:"):
             for prd in OPENSUSE_RELEASED_VERSION:
@@ -313,24 +367,32 @@ class FccSubmitter(object):
 
         pseudometa_project, pseudometa_package = project_pseudometa_package(self.apiurl, 'openSUSE:Factory')
         skip_pkgs_list = self.load_skip_pkgs_list(pseudometa_project, pseudometa_package).splitlines()
+        skip_pkgs_patterns = patterns_compile(line.strip() for line in skip_pkgs_list)
+        except_pkgs_patterns = patterns_compile(self.except_pkgs_list)
 
         ms_packages = []  # collect multi specs packages
 
-        for i in range(0, min(int(self.submit_limit), len(succeeded_packages))):
-            package = succeeded_packages[i]
+        candidates = succeeded_packages[:int(self.submit_limit)]
+        # only packages living in the target itself can have a _link there
+        linked = [package for package in candidates if package in target_packages]
+        http_pool_grow(self.apiurl, FETCH_WORKERS)
+        with ThreadPoolExecutor(max_workers=FETCH_WORKERS) as executor:
+            sle_base_pkgs = {package for package, sle_base in zip(linked, executor.map(self.is_sle_base_pkgs, linked))
+                             if sle_base}
+
+        for i, package in enumerate(candidates):
             submit_ok = True
 
             if package in deleted_packages:
                 logging.info('%s has been dropped from %s, ignore it!' % (package, self.to_prj))
                 submit_ok = False
 
-            if self.is_sle_base_pkgs(package) is True:
+            if package in sle_base_pkgs:
                 logging.info('%s origin from SLE base, skip for now!' % package)
                 submit_ok = False
 
             # make sure it is new package
-            new_pkg = self.is_new_package(self.to_prj, package)
-            if new_pkg is not True:
+            if package in existing_packages:
                 logging.info('%s is not a new package, do not submit.' % package)
                 submit_ok = False
 
@@ -368,30 +430,14 @@ class FccSubmitter(object):
                     # check devel project does not in the skip list
                     if devel_prj in self.skip_devel_project_list:
                         # check the except packages list
-                        match = None
-                        for elem in self.except_pkgs_list:
-                            m = re.search(elem, package)
-                            if m is not None:
-                                match = True
-
-                        if match is not True:
+                        if not patterns_search(except_pkgs_patterns, package):
                             logging.info('%s/%s is in the skip list, do not submit.' % (devel_prj, package))
                             continue
-                        else:
-                            pass
 
                     # check package does not in the skip list
-                    match = None
-                    for elem in skip_pkgs_list:
-                        m = re.search(str(elem), package)
-                        if m is not None:
-                            match = True
-
-                    if match is True:
+                    if patterns_search(skip_pkgs_patterns, package):
                         logging.info('%s is in the skip list, do not submit.' % package)
                         continue
-                    else:
-                        pass
 
                     res = self.create_submitrequest(package)
                     if res and res is not None:
@@ -400,7 +446,6 @@ class FccSubmitter(object):
                         logging.error('Error occurred when creating submit request')
             else:
                 logging.debug('%s is exist in %s, skip!' % (package, self.to_prj))
-            time.sleep(5)
 
         # dump multi specs packages
         print("Multi-specfile packages:")
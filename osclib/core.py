@@ -379,6 +379,7 @@ def builddepinfo(apiurl, project, repo, arch, order=False):
     return ET.parse(http_GET(url)).getroot()
 
 
+@memoize(session=True)
 def entity_email(apiurl, key, entity_type='person', include_name=False):
     url = makeurl(apiurl, [entity_type, key])
     root = ET.parse(http_GET(url)).getroot()
@@ -1002,6 +1003,35 @@ def search(apiurl, path, xpath, query={}):
     return ET.parse(http_GET(url)).getroot()
 
 
+def http_pool_grow(apiurl, maxsize):
+    """
+    Let the connection pool osc uses for apiurl keep up to maxsize connections.
+
+    osc >= 1.0 keeps its connections to each apiurl alive in a urllib3 pool,
+    but that pool only holds on to a single connection and osc offers no setting
+    for it. When requests are made from several threads, every connection beyond
+    that is closed once used. Call this before fanning out to threads.
+    """
+    try:
+        from osc.connection import CONNECTION_POOLS
+    except ImportError:
+        # older osc opens a new connection per request anyway
+        return
+
+    url = makeurl(apiurl, ['about'])
+    # osc only sets up the pool with the first request
+    key = conf.extract_known_apiurl(url)
+    if key not in CONNECTION_POOLS:
+        http_GET(url).read()
+
+    queue = getattr(CONNECTION_POOLS.get(key), 'pool', None)
+    if queue is None or not hasattr(queue, 'maxsize'):
+        logging.debug('Can not grow the connection pool of %s, requests in parallel will reconnect', apiurl)
+        return
+    if queue.maxsize < maxsize:
+        queue.maxsize = maxsize
+
+
 def action_is_patchinfo(action):
     return (action.type == 'maintenance_incident' and (
         action.src_package == 'patchinfo' or action.src_package.startswith('patchinfo.')))
@@ -1,5 +1,6 @@
 from datetime import datetime
 import fcntl
+from functools import partial
 from functools import wraps
 import os
 from osclib.cache_manager import CacheManager
@@ -121,10 +122,13 @@ def memoize(ttl=None, session=False, add_invalidate=False):
             return key
 
         def _invalidate(*args, **kwargs):
-            key = _key((args, kwargs))
+            # same key as _fn() uses
+            first = str(args[0]) if isinstance(args[0], object) else args[0]
+            key = _key((first, args[1:], kwargs))
             cache = _open_cache(cache_name)
             if key in cache:
                 del cache[key]
+            _close_cache(cache)
 
         def _invalidate_all():
             cache = _open_cache(cache_name)
@@ -133,7 +137,7 @@ def memoize(ttl=None, session=False, add_invalidate=False):
         def _add_invalidate_method(_self):
             name = '_invalidate_%s' % fn.__name__
             if not hasattr(_self, name):
-                setattr(_self, name, _invalidate)
+                setattr(_self, name, partial(_invalidate, _self))
 
             name = '_invalidate_all'
             if not hasattr(_self, name):
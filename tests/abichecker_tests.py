@@ -0,0 +1,46 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'abichecker'))
+
+# the checker needs the rpm bindings and sqlalchemy
+try:
+    import abichecker
+except ImportError:
+    abichecker = None
+
+
+def newc(name, data, mode=0o100644):
+    """A member of a newc cpio archive."""
+    fields = (0, mode, 0, 0, 1, 0, len(data), 0, 0, 0, 0, len(name) + 1, 0)
+    member = b'070701' + b''.join(b'%08x' % field for field in fields) + name + b'\0'
+    member += b'\0' * (-len(member) % 4)
+    return member + data + b'\0' * (-len(data) % 4)
+
+
+@unittest.skipIf(abichecker is None, 'abichecker needs the rpm bindings and sqlalchemy')
+class TestCpioMembers(unittest.TestCase):
+    def test_members(self):
+        files = [
+            (b'./usr/lib64/libfoo.so.1', b'\x7fELF library'),
+            (b'./usr/lib64/libfoo.so', b''),
+            (b'./usr/lib/debug/usr/lib64/libfoo.so.1.debug', b'debug'),
+            (b'./a', b'xyz'),
+        ]
+        buf = b''.join(newc(name, data) for name, data in files) + newc(b'TRAILER!!!', b'')
+
+        members = list(abichecker.cpio_members(buf))
+        self.assertEqual([name for name, _, _ in members], [name for name, _ in files])
+        for (_, pos, size), (_, data) in zip(members, files):
+            self.assertEqual(buf[pos:pos + size], data)
+
+    def test_empty(self):
+        self.assertEqual(list(abichecker.cpio_members(newc(b'TRAILER!!!', b''))), [])
+
+    def test_invalid(self):
+        buf = newc(b'./a', b'xyz') + b'070707' + b'0' * 104
+        members = abichecker.cpio_members(buf)
+        self.assertEqual(next(members)[0], b'./a')
+        with self.assertRaises(abichecker.FetchError):
+            next(members)
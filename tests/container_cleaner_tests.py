@@ -18,26 +18,22 @@ class MockedContainerCleaner(ContainerCleaner):
                 all_archs += archs
 
             return list(set(all_archs))
-        elif path[0:3] == ["build", "mock:prj", "containers"] and len(path) == 4:
-            ret = []
-            for srccontainer in self.container_arch_map:
-                ret += [srccontainer]
-
-            return ret
         else:
             raise RuntimeError("Path %s not expected" % path)
 
-    def getDirBinaries(self, path):
-        """Mock certain OBS APIs returning a list of binaries"""
-        if path[0:3] == ["build", "mock:prj", "containers"] and len(path) == 5:
-            arch = path[3]
-            srccontainer = path[4]
-            if arch in self.container_arch_map[srccontainer]:
-                return ["A binary"]
+    def growConnectionPool(self):
+        """Mock the OBS connection setup, there is nothing to connect to"""
 
-            return []
-        else:
-            raise RuntimeError("Path %s not expected" % path)
+    def getBinaryList(self, project, arch):
+        """Mock the OBS API returning the binaries of all containers of an arch"""
+        if project != "mock:prj":
+            raise RuntimeError("Project %s not expected" % project)
+
+        ret = {}
+        for srccontainer, archs in self.container_arch_map.items():
+            ret[srccontainer] = ["A binary"] if arch in archs else []
+
+        return ret
 
 
 class TestContainerCleaner(unittest.TestCase):
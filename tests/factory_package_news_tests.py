@@ -0,0 +1,73 @@
+import importlib.util
+import os
+import struct
+import tempfile
+import unittest
+
+# the script has a dash in its name and needs the rpm bindings
+try:
+    spec = importlib.util.spec_from_file_location(
+        'factory_package_news',
+        os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'factory-package-news', 'factory-package-news.py'))
+    fpn = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(fpn)
+except ImportError:
+    fpn = None
+
+
+def header(il, dl):
+    """A header structure with il index entries and dl bytes of data."""
+    return b'\x8e\xad\xe8\x01' + b'\0' * 4 + struct.pack('>II', il, dl) + b'\1' * (16 * il + dl)
+
+
+def rpm(signature_dl, header_dl):
+    lead = b'\xed\xab\xee\xdb' + b'\0' * 92
+    signature = header(1, signature_dl)
+    signature += b'\0' * (-(len(lead) + len(signature)) % 8)
+    return lead + signature + header(2, header_dl)
+
+
+@unittest.skipIf(fpn is None, 'factory-package-news needs the rpm bindings')
+class TestRpmHeader(unittest.TestCase):
+    def test_size(self):
+        # 96 lead, 16 + 16 + 5 signature padded to 136, 16 + 32 + 10 header
+        buf = rpm(5, 10)
+        self.assertEqual(len(buf), 194)
+        self.assertEqual(fpn.rpm_header_size(buf), 194)
+        self.assertEqual(fpn.rpm_header_size(buf + b'payload'), 194)
+
+    def test_size_partial(self):
+        buf = rpm(5, 10)
+        # the lead magic is always there, the first read gets more than that
+        for end in range(4, len(buf)):
+            size = fpn.rpm_header_size(buf[:end])
+            # asks for more until the whole header is there
+            self.assertGreater(size, end)
+            self.assertLessEqual(size, len(buf))
+
+    def test_not_rpm(self):
+        self.assertEqual(fpn.rpm_header_size(b'not an rpm'), 10)
+        buf = rpm(5, 10)
+        self.assertEqual(fpn.rpm_header_size(buf[:96] + b'x' * 98), 194)
+
+    def test_read_split(self):
+        buf = rpm(1000, 3000)
+        read_size = fpn.RPM_HEADER_READ_SIZE
+        with tempfile.TemporaryFile() as f:
+            f.write(b'junk' + buf + b'payload')
+            f.flush()
+            try:
+                # the first read only gets the start of the signature
+                fpn.RPM_HEADER_READ_SIZE = 100
+                self.assertEqual(fpn.read_rpm_header(f.fileno(), 4), buf)
+            finally:
+                fpn.RPM_HEADER_READ_SIZE = read_size
+            # a single read may get some of the payload along
+            self.assertTrue(fpn.read_rpm_header(f.fileno(), 4).startswith(buf))
+
+    def test_read_truncated(self):
+        buf = rpm(5, 10)
+        with tempfile.TemporaryFile() as f:
+            f.write(buf[:150])
+            f.flush()
+            self.assertEqual(fpn.read_rpm_header(f.fileno(), 0), buf[:150])
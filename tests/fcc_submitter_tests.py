@@ -0,0 +1,41 @@
+import unittest
+
+from fcc_submitter import patterns_compile
+from fcc_submitter import patterns_search
+
+
+class TestPatterns(unittest.TestCase):
+    def test_no_patterns(self):
+        self.assertEqual(patterns_compile([]), [])
+        self.assertEqual(patterns_compile(['', '']), [])
+        self.assertFalse(patterns_search([], 'vim'))
+
+    def test_skip_list(self):
+        skip_pkgs_list = '  ^golang-\n\n   \nnodejs$\n'.splitlines()
+        skip_pkgs_patterns = patterns_compile(line.strip() for line in skip_pkgs_list)
+
+        self.assertTrue(patterns_search(skip_pkgs_patterns, 'golang-x-net'))
+        self.assertTrue(patterns_search(skip_pkgs_patterns, 'nodejs'))
+        self.assertFalse(patterns_search(skip_pkgs_patterns, 'python-golang-x'))
+        self.assertFalse(patterns_search(skip_pkgs_patterns, 'nodejs-common'))
+        # the blank lines must not turn into a pattern matching everything
+        self.assertFalse(patterns_search(skip_pkgs_patterns, 'vim'))
+
+    def test_anchors(self):
+        patterns = patterns_compile([r'^a|b$', r'^c$'])
+
+        self.assertTrue(patterns_search(patterns, 'ax'))
+        self.assertTrue(patterns_search(patterns, 'xb'))
+        self.assertTrue(patterns_search(patterns, 'c'))
+        self.assertFalse(patterns_search(patterns, 'xc'))
+        self.assertFalse(patterns_search(patterns, 'cx'))
+
+    def test_flags_and_groups(self):
+        patterns = patterns_compile([r'(x)\1', r'(?i)^perl-', r'(y)\1$'])
+
+        self.assertTrue(patterns_search(patterns, 'Perl-Foo'))
+        self.assertTrue(patterns_search(patterns, 'axx'))
+        self.assertTrue(patterns_search(patterns, 'ayy'))
+        self.assertFalse(patterns_search(patterns, 'ayyz'))
+        # the flag of one pattern doesn't apply to the others
+        self.assertFalse(patterns_search(patterns, 'aYY'))
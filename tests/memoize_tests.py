@@ -0,0 +1,49 @@
+import unittest
+
+from osclib.memoize import memoize
+from osclib.memoize import memoize_session_reset
+
+
+class Counter(object):
+    def __init__(self, name):
+        self.name = name
+        self.calls = 0
+
+    def __str__(self):
+        return self.name
+
+    @memoize(session=True, add_invalidate=True)
+    def value(self, arg):
+        self.calls += 1
+        return '{}-{}'.format(arg, self.calls)
+
+
+class TestMemoize(unittest.TestCase):
+    def setUp(self):
+        memoize_session_reset()
+
+    def test_cached(self):
+        counter = Counter('cached')
+        self.assertEqual(counter.value('a'), 'a-1')
+        self.assertEqual(counter.value('a'), 'a-1')
+        self.assertEqual(counter.calls, 1)
+
+    def test_invalidate(self):
+        counter = Counter('invalidate')
+        self.assertEqual(counter.value('a'), 'a-1')
+        self.assertEqual(counter.value('b'), 'b-2')
+
+        counter._invalidate_value('a')
+        self.assertEqual(counter.value('a'), 'a-3')
+        # other entries are kept
+        self.assertEqual(counter.value('b'), 'b-2')
+        self.assertEqual(counter.calls, 3)
+
+    def test_invalidate_all(self):
+        counter = Counter('invalidate_all')
+        counter.value('a')
+        counter.value('b')
+
+        counter._invalidate_all()
+        self.assertEqual(counter.value('a'), 'a-3')
+        self.assertEqual(counter.value('b'), 'b-4')